@@ -91,6 +91,19 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedStaticFilesStorage'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# --- EMAIL (Seat Notifications) ---
+# Locally, set EMAIL_BACKEND to django.core.mail.backends.filebased.EmailBackend
+# (messages land in EMAIL_FILE_PATH) or ...locmem.EmailBackend.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'False') == 'True'
+EMAIL_TIMEOUT = 30
+EMAIL_FILE_PATH = BASE_DIR / 'sent_emails'
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'exams@kca.ac.ke')
+
 # --- JAZZMIN SETTINGS ---
 JAZZMIN_SETTINGS = {
     "site_title": "KCA Exam Admin",
@@ -105,3 +118,8 @@ JAZZMIN_SETTINGS = {
     ],
     "show_ui_builder": False,
 }
+
+# --- SEAT API KEYS (Kiosks + SMS Gateway) ---
+# Comma-separated keys allowed to page through whole exam rosters
+# (/api/exams/<id>/seats/) with "Authorization: Api-Key <key>". Staff logins work too.
+SEAT_API_KEYS = [key.strip() for key in os.environ.get('SEAT_API_KEYS', '').split(',') if key.strip()]
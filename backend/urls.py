@@ -9,7 +9,12 @@ from core.views import (
     student_login, 
     student_signup,        
     unit_registration,
-    student_dashboard      # <--- Imported correctly
+    student_dashboard,     # <--- Imported correctly
+    seat_lookup_api,
+    exam_seats_api,
+    checkin_page,
+    checkin_pack,
+    checkin_sync,
 )
 
 urlpatterns = [
@@ -34,4 +39,13 @@ urlpatterns = [
     # --- 4. STAFF REPORTS ---
     path('print/<int:exam_id>/', exam_attendance_sheet, name='print_sheet'),
     path('door-lists/<int:exam_id>/', room_door_lists, name='door_lists'),
+
+    # --- 5. SEAT LOOKUP API ---
+    path('api/seats/', seat_lookup_api, name='seat_lookup_api'),
+    path('api/exams/<int:exam_id>/seats/', exam_seats_api, name='exam_seats_api'),
+
+    # --- 6. EXAM ROOM CHECK-IN ---
+    path('checkin/<int:exam_id>/<int:room_id>/', checkin_page, name='checkin_page'),
+    path('checkin/<int:exam_id>/<int:room_id>/pack/', checkin_pack, name='checkin_pack'),
+    path('checkin/<int:exam_id>/<int:room_id>/sync/', checkin_sync, name='checkin_sync'),
 ]
\ No newline at end of file
@@ -3,27 +3,59 @@ import io
 from django.shortcuts import render, redirect
 from django.urls import path
 from django.contrib import admin
+from django.contrib.admin.utils import get_last_value_from_parameters
 from django import forms
 from django.contrib import messages
 from django.http import HttpResponse
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
 from django.core.management import call_command # <--- Required for the Allocation Button
 from django.contrib.auth.models import User
 from django.contrib.auth.admin import UserAdmin
-from .models import Student, Room, Course, Exam, SeatAssignment
+from .models import Student, Room, Course, Exam, SeatAssignment, AllocationSnapshot, SeatNotification
+from .notifications import deliver_in_background
 
 # --- 1. THE ALLOCATION ACTION (The "Magic Button") ---
+# Every action that publishes seats also starts emailing students in the background.
+def send_seat_emails(modeladmin, request, exam_ids):
+    if exam_ids:
+        deliver_in_background(exam_ids)
+        modeladmin.message_user(request, "Seat emails are being sent in the background (see Seat notifications).")
+
 @admin.action(description='⚡ Allocate Seats for Selected Exams')
 def run_allocation(modeladmin, request, queryset):
-    success_count = 0
+    allocated = []
     for exam in queryset:
         try:
             call_command('allocate', exam.id)
-            success_count += 1
+            allocated.append(exam.id)
         except Exception as e:
             modeladmin.message_user(request, f"Error for {exam}: {str(e)}", messages.ERROR)
 
-    if success_count > 0:
-        modeladmin.message_user(request, f"Successfully allocated seats for {success_count} exams!", messages.SUCCESS)
+    if allocated:
+        modeladmin.message_user(request, f"Successfully allocated seats for {len(allocated)} exams!", messages.SUCCESS)
+        send_seat_emails(modeladmin, request, allocated)
+
+@admin.action(description='🧩 Seat Selected Exams Together (Same Time, Shared Rooms)')
+def run_session_allocation(modeladmin, request, queryset):
+    exam_ids = list(queryset.values_list('id', flat=True))
+    try:
+        call_command('allocate_session', *exam_ids)
+        modeladmin.message_user(request, f"Successfully allocated {len(exam_ids)} exams together!", messages.SUCCESS)
+    except Exception as e:
+        modeladmin.message_user(request, f"Error: {str(e)}", messages.ERROR)
+        return
+    send_seat_emails(modeladmin, request, exam_ids)
+
+@admin.action(description='⏪ Roll Back to Previous Allocation')
+def rollback_allocation(modeladmin, request, queryset):
+    for exam in queryset:
+        out = io.StringIO()
+        call_command('publish_allocation', exam.id, previous=True, stdout=out)
+        modeladmin.message_user(request, out.getvalue().strip())
+    # Students told about the newer version hear about the one they're back on
+    send_seat_emails(modeladmin, request, list(queryset.values_list('id', flat=True)))
 
 # --- 2. THE EXPORT FUNCTION ---
 def export_to_csv(modeladmin, request, queryset):
@@ -48,12 +80,99 @@ export_to_csv.short_description = "📂 Export Selected to CSV"
 class CsvImportForm(forms.Form):
     csv_file = forms.FileField()
 
-# --- 4. STUDENT ADMIN (Import + Export) ---
+# --- 4. LARGE-TABLE MODE (Millions of Seat Assignments) ---
+# Tables above this many rows get an estimated count instead of COUNT(*).
+ESTIMATED_COUNT_THRESHOLD = 100_000
+
+class EstimatedCountPaginator(Paginator):
+    """Uses the database's row estimate for unfiltered changelists."""
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = self._estimated_count()
+            if estimate is not None and estimate > ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+    def _estimated_count(self):
+        # Only Postgres keeps a cheap estimate (pg_class.reltuples).
+        # SQLite has nothing comparable, so it falls back to a real count.
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [self.object_list.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+class AutocompleteFilter(admin.FieldListFilter):
+    """
+    Sidebar filter for a ForeignKey that searches through the admin
+    autocomplete view instead of loading every related row.
+    The related model's admin must define search_fields.
+    """
+    template = 'admin/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f"{field_path}__{field.target_field.name}__exact"
+        self.lookup_val = get_last_value_from_parameters(params, self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.app_label = model._meta.app_label
+        self.model_name = model._meta.model_name
+        self.field_name = field.name
+        self.selected = None
+        if self.lookup_val:
+            self.selected = field.related_model._default_manager.filter(pk=self.lookup_val).first()
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': 'All',
+        }
+        if self.selected is not None:
+            yield {
+                'selected': True,
+                'query_string': changelist.get_query_string({self.lookup_kwarg: self.selected.pk}),
+                'display': str(self.selected),
+            }
+
+class LargeTableAdminMixin:
+    """
+    Changelist settings for tables with millions of rows:
+    no full COUNT(*), estimated pagination and exact-match search
+    on an indexed column before falling back to the slow LIKE search.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    indexed_search_field = None  # e.g. 'registration_number'
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if self.indexed_search_field and term:
+            # Reg numbers are stored upper-case (see student_signup)
+            lookup = {f"{self.indexed_search_field}__in": {term, term.upper()}}
+            exact = queryset.filter(**lookup)
+            if exact.exists():
+                return exact, False
+        return super().get_search_results(request, queryset, search_term)
+
+# --- 5. STUDENT ADMIN (Import + Export) ---
 @admin.register(Student)
-class StudentAdmin(admin.ModelAdmin):
+class StudentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('registration_number', 'first_name', 'last_name', 'has_special_needs')
     search_fields = ('registration_number', 'first_name', 'last_name')
+    ordering = ('registration_number',)
     list_filter = ('has_special_needs',)
+    indexed_search_field = 'registration_number'
     actions = [export_to_csv]
     
     # Point to our custom template with the button
@@ -96,30 +215,88 @@ class StudentAdmin(admin.ModelAdmin):
         payload = {"form": form}
         return render(request, "admin/csv_upload.html", payload)
 
-# --- 5. EXAM ADMIN (Allocation + Export) ---
+# --- 6. EXAM ADMIN (Allocation + Export) ---
 @admin.register(Exam)
-class ExamAdmin(admin.ModelAdmin):
+class ExamAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('course', 'date_time', 'duration_minutes')
+    list_select_related = ('course',)
+    list_filter = (('course', AutocompleteFilter),)
+    search_fields = ('course__code', 'course__name')
+    autocomplete_fields = ('course',)
+    ordering = ('-date_time', 'id')
     # MERGED ACTIONS: Now you can Allocat AND Export
-    actions = [run_allocation, export_to_csv] 
+    actions = [run_allocation, run_session_allocation, rollback_allocation, export_to_csv]
 
-# --- 6. OTHER ADMINS ---
+    def get_queryset(self, request):
+        # The autocomplete views ignore list_select_related, and Exam.__str__ reads exam.course
+        return super().get_queryset(request).select_related('course')
+
+# --- 7. OTHER ADMINS ---
 @admin.register(Room)
 class RoomAdmin(admin.ModelAdmin):
-    list_display = ('name', 'capacity', 'is_accessible', 'capacity_status')
+    list_display = ('name', 'capacity', 'is_accessible', 'capacity_status', 'layout')
+    search_fields = ('name',)
+    ordering = ('name',)
     actions = [export_to_csv]
     def capacity_status(self, obj): return f"{obj.capacity} Seats Max"
+    def layout(self, obj): return f"{obj.rows} x {obj.columns}" if obj.has_layout else "-"
+
+    def get_readonly_fields(self, request, obj=None):
+        # Room.save() works the capacity out from the layout, so typing one would be ignored
+        if obj is not None and obj.has_layout:
+            return ('capacity',)
+        return ()
 
 @admin.register(SeatAssignment)
-class SeatAssignmentAdmin(admin.ModelAdmin):
-    list_display = ('student', 'exam', 'room', 'seat_number')
-    list_filter = ('exam', 'room')
+class SeatAssignmentAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('student', 'exam', 'room', 'seat_number', 'snapshot')
+    # Exam.__str__ reads exam.course, so join it too
+    list_select_related = ('student', 'exam__course', 'room', 'snapshot')
+    list_filter = (('exam', AutocompleteFilter), ('room', AutocompleteFilter))
+    autocomplete_fields = ('student', 'exam', 'room')
+    # Set by SeatAssignment.save() (the exam's live version); a <select> would load every blob
+    readonly_fields = ('snapshot',)
     actions = [export_to_csv]
     search_fields = ('student__registration_number',)
+    indexed_search_field = 'student__registration_number'
+
+@admin.register(AllocationSnapshot)
+class AllocationSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('exam', 'version', 'seat_count', 'is_live', 'is_materialized', 'created_at')
+    list_select_related = ('exam__course',)
+    exclude = ('seats',)
+    readonly_fields = ('exam', 'version', 'seat_count', 'is_materialized', 'created_at')
+    actions = ['publish_snapshots']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('seats')
+
+    @admin.display(boolean=True)
+    def is_live(self, obj): return obj.exam.published_snapshot_id == obj.pk
+
+    @admin.action(description='🚀 Publish Selected Versions')
+    def publish_snapshots(self, request, queryset):
+        for snapshot in queryset:
+            snapshot.publish()
+        self.message_user(request, f"Published {queryset.count()} allocation versions.", messages.SUCCESS)
+        send_seat_emails(self, request, set(queryset.values_list('exam_id', flat=True)))
+
+@admin.register(SeatNotification)
+class SeatNotificationAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ('student', 'snapshot', 'status', 'attempts', 'sent_at', 'last_error')
+    list_select_related = ('student', 'snapshot')
+    list_filter = ('status',)
+    search_fields = ('student__registration_number',)
+    indexed_search_field = 'student__registration_number'
+    readonly_fields = ('snapshot', 'student', 'status', 'claim', 'attempts', 'last_error', 'sent_at')
 
-admin.site.register(Course)
+@admin.register(Course)
+class CourseAdmin(admin.ModelAdmin):
+    list_display = ('code', 'name')
+    search_fields = ('code', 'name')
+    ordering = ('code',)
 
-# --- 7. STAFF/USER IMPORTER ---
+# --- 8. STAFF/USER IMPORTER ---
 # Unregister the default User admin so we can use our own
 try:
     admin.site.unregister(User)
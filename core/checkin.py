@@ -0,0 +1,142 @@
+"""
+Exam-room check-in from the docket QR code.
+
+The QR carries "<reg_number>:<signature>" (django.core.signing), so a
+scanned code can't be forged but the reg number is still readable
+offline. Each exam's seating is loaded once per allocation version into a
+dict in the cache. After that, every scan is a single dict lookup.
+"""
+import gzip
+import json
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core import signing
+from django.core.cache import cache
+from django.utils import timezone
+
+from .models import CheckIn, SeatAssignment
+
+SIGNER = signing.Signer(salt='core.checkin')
+ROSTER_CACHE_SECONDS = 60 * 60 * 24
+# Offline devices may sync late, but no scan is older than this before the exam starts
+EARLIEST_SCAN = timedelta(days=1)
+
+# Results for one scanned code
+OK = 'ok'
+ALREADY = 'already_checked_in'
+WRONG_ROOM = 'wrong_room'
+NOT_SEATED = 'not_seated'
+INVALID = 'invalid'
+
+
+def make_code(reg_number):
+    """What goes into the docket QR code."""
+    return SIGNER.sign(reg_number)
+
+
+def read_code(code):
+    """Returns the reg number in a scanned code, or None if the signature is wrong."""
+    try:
+        return SIGNER.unsign(code.strip())
+    except signing.BadSignature:
+        return None
+
+
+def exam_roster(exam):
+    """{reg_number: (student_id, room_id, room_name, seat_number, name)} for the published seating."""
+    key = f"checkin-roster:{exam.id}:v{exam.allocation_version}"
+    roster = cache.get(key)
+    if roster is None:
+        rows = (
+            SeatAssignment.objects.filter(exam=exam, snapshot_id=exam.published_snapshot_id)
+            .values_list(
+                'student__registration_number', 'student_id', 'room_id', 'room__name', 'seat_number',
+                'student__first_name', 'student__last_name',
+            )
+        )
+        roster = {
+            reg: (student_id, room_id, room_name, seat, f"{first} {last}")
+            for reg, student_id, room_id, room_name, seat, first, last in rows
+        }
+        cache.set(key, roster, ROSTER_CACHE_SECONDS)
+    return roster
+
+
+def room_pack(exam, room):
+    """
+    The room's roster as gzipped JSON for scanning devices to keep offline.
+    Built once per allocation version.
+    """
+    key = f"checkin-pack:{exam.id}:{room.id}:v{exam.allocation_version}"
+    pack = cache.get(key)
+    if pack is None:
+        seats = {
+            reg: [name, seat]
+            for reg, (_, room_id, _, seat, name) in exam_roster(exam).items()
+            if room_id == room.id
+        }
+        payload = {
+            'exam': exam.id,
+            'course': exam.course.code,
+            'room': room.name,
+            'version': exam.allocation_version,
+            'seats': seats,
+        }
+        pack = gzip.compress(json.dumps(payload, separators=(',', ':')).encode(), mtime=0)
+        cache.set(key, pack, ROSTER_CACHE_SECONDS)
+    return pack
+
+
+def scan_time(exam, at):
+    """
+    When a scan happened, from the device's epoch ms. Clamped between a day before
+    the exam and now; anything that isn't a finite number means now.
+    """
+    now = timezone.now()
+    if isinstance(at, bool) or not isinstance(at, (int, float)):
+        return now
+    try:
+        at = float(at)  # JSON integers can be far beyond float range
+    except OverflowError:
+        return now
+    if not math.isfinite(at):
+        return now
+    earliest = (exam.date_time - EARLIEST_SCAN).timestamp()
+    return datetime.fromtimestamp(min(max(at / 1000, earliest), now.timestamp()), tz=dt_timezone.utc)
+
+
+def record_scans(exam, room, scans):
+    """
+    Checks a batch of scans ({"code": ..., "at": epoch ms}) against the roster and
+    saves the valid ones in one bulk insert. Returns one result dict per scan.
+    """
+    roster = exam_roster(exam)
+    regs = [read_code(scan['code']) if isinstance(scan.get('code'), str) else None for scan in scans]
+    seated_ids = {roster[reg][0] for reg in regs if reg in roster}
+    already = set(CheckIn.objects.filter(exam=exam, student_id__in=seated_ids).values_list('student_id', flat=True))
+
+    results, new_checkins = [], []
+    for scan, reg in zip(scans, regs):
+        seat = roster.get(reg) if reg else None
+        if reg is None:
+            results.append({'status': INVALID})
+            continue
+        if seat is None:
+            results.append({'status': NOT_SEATED, 'reg': reg})
+            continue
+
+        student_id, room_id, room_name, seat_number, name = seat
+        if room_id != room.id:
+            results.append({'status': WRONG_ROOM, 'reg': reg, 'name': name, 'room': room_name, 'seat': seat_number})
+        elif student_id in already:
+            results.append({'status': ALREADY, 'reg': reg, 'name': name, 'seat': seat_number})
+        else:
+            already.add(student_id)
+            # Offline devices send when the scan really happened
+            scanned_at = scan_time(exam, scan.get('at'))
+            new_checkins.append(CheckIn(exam=exam, room=room, student_id=student_id, checked_in_at=scanned_at))
+            results.append({'status': OK, 'reg': reg, 'name': name, 'seat': seat_number})
+
+    CheckIn.objects.bulk_create(new_checkins, ignore_conflicts=True)
+    return results
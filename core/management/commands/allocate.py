@@ -1,11 +1,21 @@
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
-from core.models import Exam, Room, SeatAssignment
+from core.models import AllocationSnapshot, Exam, Room, SeatAssignment
+from core.seating import seat_labels
 
 class Command(BaseCommand):
     help = 'Allocates seats for a specific exam with Anti-Collision Logic'
 
     def add_arguments(self, parser):
         parser.add_argument('exam_id', type=int, help='ID of the exam to allocate')
+        parser.add_argument(
+            '--no-publish', action='store_true',
+            help='Save the result as a new version without making it live (see publish_allocation)',
+        )
+        parser.add_argument(
+            '--notify', action='store_true',
+            help='Email every student their seat right after publishing (see send_seat_notifications)',
+        )
 
     def handle(self, *args, **options):
         exam_id = options['exam_id']
@@ -18,8 +28,8 @@ class Command(BaseCommand):
 
         self.stdout.write(f"Starting allocation for: {exam}...")
 
-        # 1. Clear old assignments for this specific exam
-        SeatAssignment.objects.filter(exam=exam).delete()
+        # 1. Nothing is deleted: the result becomes a new AllocationSnapshot,
+        # and students keep seeing the current version until it is published.
 
         # 2. GET STUDENTS (FIXED HERE)
         # We now get students via the Course they enrolled in.
@@ -35,7 +45,7 @@ class Command(BaseCommand):
         regular_students = all_students.filter(has_special_needs=False)
 
         # 3. Get all rooms (Accessible first)
-        all_rooms = Room.objects.all().order_by('-is_accessible', '-capacity') 
+        all_rooms = Room.objects.filter(capacity__gt=0).order_by('-is_accessible', '-capacity')
 
         # 4. The Allocation Loop
         student_queue = list(special_needs_students) + list(regular_students)
@@ -43,20 +53,26 @@ class Command(BaseCommand):
         rooms_iter = iter(all_rooms)
         current_room = next(rooms_iter, None)
         seats_filled_in_room = 0
+        # "1", "2", ... or "A1", "A2", ... if the room has a layout
+        room_seats = seat_labels(current_room) if current_room else []
 
         # Track success count for report
         assigned_count = 0
+        new_seats = []
+
+        # Everyone already sitting a live exam at this EXACT time (one query)
+        busy_student_ids = set(
+            SeatAssignment.objects.published()
+            .filter(exam__date_time=exam.date_time)
+            .exclude(exam=exam)
+            .values_list('student_id', flat=True)
+        )
 
         for student in student_queue:
             
             # --- ANTI-CLASH CHECK ---
             # Check if student is busy at this EXACT time in another exam
-            conflict = SeatAssignment.objects.filter(
-                student=student,
-                exam__date_time=exam.date_time
-            ).exclude(exam=exam).exists()
-
-            if conflict:
+            if student.id in busy_student_ids:
                 self.stdout.write(self.style.ERROR(f"CRITICAL CONFLICT: {student} has another exam at {exam.date_time}! Skipping."))
                 continue 
 
@@ -70,22 +86,33 @@ class Command(BaseCommand):
                 self.stdout.write(self.style.WARNING(f"Warning: Accessible room needed for {student}, but placed in {current_room}"))
 
             # Assign the seat
-            seat_number = str(seats_filled_in_room + 1)
-            SeatAssignment.objects.create(
-                exam=exam,
-                student=student,
-                room=current_room,
-                seat_number=seat_number
-            )
+            seat_number = room_seats[seats_filled_in_room]
+            new_seats.append((student.id, current_room.id, seat_number))
             
             assigned_count += 1
             # self.stdout.write(f"Assigned {student} to {current_room} Seat {seat_number}")
 
             # Handle Room Capacity
             seats_filled_in_room += 1
-            if seats_filled_in_room >= current_room.capacity:
+            if seats_filled_in_room >= len(room_seats):
                 self.stdout.write(self.style.SUCCESS(f"Room {current_room} is full."))
                 current_room = next(rooms_iter, None)
                 seats_filled_in_room = 0
+                room_seats = seat_labels(current_room) if current_room else []
+
+        # 5. Save as a new version, then switch it live in one UPDATE
+        snapshot = AllocationSnapshot.record(exam, new_seats)
+        if options['no_publish']:
+            self.stdout.write(self.style.SUCCESS(
+                f'Allocation Complete! {assigned_count} students assigned in version {snapshot.version} (not published).'
+            ))
+            return
+
+        snapshot.publish()
+        self.stdout.write(self.style.SUCCESS(
+            f'Allocation Complete! {assigned_count} students assigned. Version {snapshot.version} is live.'
+        ))
 
-        self.stdout.write(self.style.SUCCESS(f'Allocation Complete! {assigned_count} students assigned.'))
\ No newline at end of file
+        # 6. Publishing queued the seat emails; send them now if asked
+        if options['notify']:
+            call_command('send_seat_notifications', exam=exam.id, stdout=self.stdout)
\ No newline at end of file
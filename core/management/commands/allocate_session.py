@@ -0,0 +1,78 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import AllocationSnapshot, Exam, Room, SeatAssignment
+from core.seating import RoomGrid, seat_groups
+
+class Command(BaseCommand):
+    help = 'Seats several exams that run at the same time together, so no two neighbours sit the same paper'
+
+    def add_arguments(self, parser):
+        parser.add_argument('exam_ids', type=int, nargs='+', help='IDs of the exams sharing the halls')
+        parser.add_argument(
+            '--no-publish', action='store_true',
+            help='Save the results as new versions without making them live (see publish_allocation)',
+        )
+
+    def handle(self, *args, **options):
+        exams = list(Exam.objects.filter(id__in=options['exam_ids']).select_related('course').order_by('id'))
+        missing = set(options['exam_ids']) - {exam.id for exam in exams}
+        if missing:
+            raise CommandError(f"Exam ID(s) {', '.join(map(str, sorted(missing)))} not found!")
+        if len({exam.date_time for exam in exams}) > 1:
+            raise CommandError('All exams in a session must start at the same time.')
+
+        date_time = exams[0].date_time
+        self.stdout.write(f"Starting session allocation for {len(exams)} exams at {date_time}...")
+
+        # 1. One queue of students per exam (special needs first)
+        # Anyone already sitting another live exam at this time is skipped
+        busy_student_ids = set(
+            SeatAssignment.objects.published()
+            .filter(exam__date_time=date_time)
+            .exclude(exam__in=exams)
+            .values_list('student_id', flat=True)
+        )
+        queues = []
+        for exam in exams:
+            queue = []
+            for student in exam.course.students.order_by('-has_special_needs', 'id'):
+                if student.id in busy_student_ids:
+                    self.stdout.write(self.style.ERROR(f"CRITICAL CONFLICT: {student} has another exam at {date_time}! Skipping."))
+                    continue
+                busy_student_ids.add(student.id)
+                queue.append(student)
+            queues.append(queue)
+
+        # 2. Fill the rooms (Accessible first); leftovers move on to the next room
+        rows_per_exam = [[] for _ in exams]
+        for room in Room.objects.filter(capacity__gt=0).order_by('-is_accessible', '-capacity'):
+            waiting = [index for index, queue in enumerate(queues) if queue]
+            if not waiting:
+                break
+
+            placements, leftovers = seat_groups(RoomGrid.from_room(room), [queues[index] for index in waiting])
+            for slot, index in enumerate(waiting):
+                for student, seat_number in placements[slot]:
+                    if student.has_special_needs and not room.is_accessible:
+                        self.stdout.write(self.style.WARNING(f"Warning: Accessible room needed for {student}, but placed in {room}"))
+                    rows_per_exam[index].append((student.id, room.id, seat_number))
+                queues[index] = leftovers[slot]
+
+            seated = ', '.join(f"{exams[index].course.code}: {len(placements[slot])}" for slot, index in enumerate(waiting))
+            self.stdout.write(f"Room {room}: {seated}")
+
+        unseated = sum(len(queue) for queue in queues)
+        if unseated:
+            self.stdout.write(self.style.ERROR(f'CRITICAL: Run out of rooms! {unseated} students not seated.'))
+
+        # 3. One new version per exam
+        for exam, rows in zip(exams, rows_per_exam):
+            snapshot = AllocationSnapshot.record(exam, rows)
+            if options['no_publish']:
+                self.stdout.write(self.style.SUCCESS(
+                    f'{exam}: {len(rows)} students assigned in version {snapshot.version} (not published).'
+                ))
+            else:
+                snapshot.publish()
+                self.stdout.write(self.style.SUCCESS(
+                    f'{exam}: {len(rows)} students assigned. Version {snapshot.version} is live.'
+                ))
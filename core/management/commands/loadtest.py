@@ -0,0 +1,372 @@
+import asyncio
+import json
+import math
+import random
+import time
+from datetime import timedelta
+from urllib.parse import quote, urlencode, urlsplit
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import CharField, Value
+from django.db.models.functions import Concat
+from django.urls import reverse
+from django.utils import timezone
+from core.models import Course, Exam, Room, SeatNotification, Student
+
+# Results-day traffic: mostly seat lookups, some logins and unit changes
+DEFAULT_MIX = 'check_seat=45,student_exam_slip=30,student_login=15,unit_registration=10'
+# A 302 is success for the form posts (they redirect to the dashboard)
+EXPECTED_STATUS = {
+    'check_seat': 200,
+    'student_exam_slip': 200,
+    'student_login': 302,
+    'unit_registration': 302,
+}
+LOAD_PREFIX = 'LOAD/'
+LOAD_PASSWORD = 'loadtest'
+LOAD_COURSE_CODE = 'LOAD 101'
+LOAD_ROOM_PREFIX = 'LOAD-'
+LOAD_EMAIL_DOMAIN = '@example.invalid'  # Reserved domain: nothing can ever be delivered there
+ROOM_CAPACITY = 250
+# Anything that means this request failed rather than the harness itself
+REQUEST_ERRORS = (OSError, EOFError, asyncio.TimeoutError, ValueError, IndexError)
+
+
+def _percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class _HttpClient:
+    """
+    A tiny keep-alive HTTP/1.1 client on asyncio streams (one per virtual student),
+    so the harness needs nothing outside the standard library.
+    """
+
+    def __init__(self, host, port, timeout):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.cookies = {}
+        self.logged_in = False
+        self._reader = None
+        self._writer = None
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+        self._reader = self._writer = None
+
+    async def request(self, method, path, form=None):
+        return await asyncio.wait_for(self._request(method, path, form), self.timeout)
+
+    async def _request(self, method, path, form):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+        body = urlencode(form, doseq=True).encode() if form is not None else b''
+        lines = [
+            f'{method} {path} HTTP/1.1',
+            f'Host: {self.host}:{self.port}',
+            'Connection: keep-alive',
+            f'Content-Length: {len(body)}',
+        ]
+        if form is not None:
+            lines.append('Content-Type: application/x-www-form-urlencoded')
+        if self.cookies:
+            lines.append('Cookie: ' + '; '.join(f'{k}={v}' for k, v in self.cookies.items()))
+        self._writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode() + body)
+        await self._writer.drain()
+
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError('Server closed the connection')
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = (await self._reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            name, value = name.strip().lower(), value.strip()
+            if name == 'set-cookie':
+                cookie_name, _, rest = value.partition('=')
+                self.cookies[cookie_name] = rest.split(';', 1)[0]
+            headers[name] = value
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            await self._read_chunked()
+        elif 'content-length' in headers:
+            await self._reader.readexactly(int(headers['content-length']))
+        else:
+            await self._reader.read()
+            headers['connection'] = 'close'
+
+        # gunicorn's sync workers close after every response
+        if headers.get('connection', '').lower() == 'close':
+            await self.close()
+        return status
+
+    async def _read_chunked(self):
+        while True:
+            size = int((await self._reader.readline()).split(b';')[0], 16)
+            await self._reader.readexactly(size + 2)  # Chunk + CRLF
+            if size == 0:
+                return
+
+
+class Command(BaseCommand):
+    help = 'Replays results-day traffic against a running server and reports latency per endpoint as JSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Base URL of the running server')
+        parser.add_argument('--clients', type=int, default=50, help='Concurrent virtual students')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Endpoint weights (default: {DEFAULT_MIX})')
+        parser.add_argument('--students', type=int, default=1000, help='Seed this many LOAD/ students if missing')
+        parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for a repeatable request sequence')
+        parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+        parser.add_argument('--baseline', help='Earlier JSON report to compare against')
+        parser.add_argument(
+            '--cleanup', action='store_true',
+            help='Delete the LOAD/ students, LOAD- rooms and load-test exam instead of running',
+        )
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self.cleanup()
+            return
+
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('--url must be a plain http:// address (https is not supported).')
+        mix = self.parse_mix(options['mix'])
+
+        try:
+            # 1. Seed (or reuse) the dataset
+            students, course_id = self.prepare_dataset(options['students'])
+
+            # 2. Fire the traffic
+            self.stderr.write(
+                f"Running {options['clients']} clients for {options['duration']}s against {options['url']}..."
+            )
+            rng = random.Random(options['seed'])
+            started = time.monotonic()
+            samples = asyncio.run(self.run_clients(url, mix, students, course_id, rng, options))
+            elapsed = time.monotonic() - started
+        finally:
+            # The harness rooms have real capacity: left behind, real allocations would use them
+            self.remove_rooms()
+
+        # 3. Report
+        report = self.build_report(samples, elapsed, options, mix)
+        if options['baseline']:
+            with open(options['baseline']) as baseline_file:
+                report['compared_to_baseline'] = self.compare(json.load(baseline_file), report)
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                output_file.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def remove_rooms(self):
+        return Room.objects.filter(name__startswith=LOAD_ROOM_PREFIX).delete()[1].get('core.Room', 0)
+
+    def cleanup(self):
+        """Removes everything prepare_dataset() created. Seats, versions and emails go with them."""
+        students = Student.objects.filter(registration_number__startswith=LOAD_PREFIX).delete()[1].get('core.Student', 0)
+        rooms = self.remove_rooms()
+        Course.objects.filter(code=LOAD_COURSE_CODE).delete()  # Cascades to the exam and its versions
+        self.stdout.write(self.style.SUCCESS(f'Removed {students} load-test students and {rooms} rooms.'))
+
+    def parse_mix(self, value):
+        mix = {}
+        for part in value.split(','):
+            name, _, weight = part.partition('=')
+            name = name.strip()
+            if name not in EXPECTED_STATUS:
+                raise CommandError(f"Unknown endpoint '{name}'. Choose from: {', '.join(EXPECTED_STATUS)}")
+            try:
+                mix[name] = float(weight)
+            except ValueError:
+                raise CommandError(f"Weight for '{name}' must be a number.")
+        if not any(weight > 0 for weight in mix.values()):
+            raise CommandError('--mix needs at least one positive weight.')
+        return mix
+
+    def prepare_dataset(self, wanted):
+        """
+        Creates LOAD/ students enrolled in one exam (or reuses the existing ones) and
+        seats them, with LOAD- rooms that only exist until handle() finishes.
+        """
+        course, _ = Course.objects.get_or_create(code=LOAD_COURSE_CODE, defaults={'name': 'Load Test'})
+        existing = Student.objects.filter(registration_number__startswith=LOAD_PREFIX).count()
+
+        if existing < wanted:
+            self.stderr.write(f'Seeding {wanted - existing} load-test students...')
+            new_students = Student.objects.bulk_create(
+                [
+                    Student(
+                        registration_number=f'{LOAD_PREFIX}{number:06d}',
+                        first_name='Load',
+                        last_name=f'Student {number}',
+                        email=f'load{number}{LOAD_EMAIL_DOMAIN}',
+                        password=LOAD_PASSWORD,
+                    )
+                    for number in range(existing + 1, wanted + 1)
+                ],
+                batch_size=1000,
+            )
+            enrolment = Student.enrolled_courses.through
+            enrolment.objects.bulk_create(
+                [enrolment(student_id=student.id, course_id=course.id) for student in new_students],
+                batch_size=1000,
+            )
+
+        # Students seeded before the reserved domain was used
+        Student.objects.filter(registration_number__startswith=LOAD_PREFIX).exclude(
+            email__endswith=LOAD_EMAIL_DOMAIN
+        ).update(email=Concat(Value('load'), 'id', Value(LOAD_EMAIL_DOMAIN), output_field=CharField()))
+
+        students = list(
+            Student.objects.filter(registration_number__startswith=LOAD_PREFIX, password=LOAD_PASSWORD)
+            .values_list('registration_number', flat=True)
+        )
+        if not students:
+            raise CommandError('No load-test students available.')
+
+        # Rooms from an earlier run that was killed before it could remove them
+        self.remove_rooms()
+        Room.objects.bulk_create(
+            [
+                Room(name=f'{LOAD_ROOM_PREFIX}{number + 1}', capacity=ROOM_CAPACITY)
+                for number in range(math.ceil(len(students) / ROOM_CAPACITY))
+            ]
+        )
+        exam, _ = Exam.objects.get_or_create(
+            course=course,
+            defaults={'date_time': timezone.now() + timedelta(days=1), 'duration_minutes': 120},
+        )
+        call_command('allocate', exam.id, stdout=self.stderr)
+        # Publishing queued seat emails; fake students must never get one
+        SeatNotification.objects.filter(snapshot__exam=exam).delete()
+        return students, course.id
+
+    async def run_clients(self, url, mix, students, course_id, rng, options):
+        deadline = time.monotonic() + options['duration']
+        samples = {name: [] for name in mix}  # name -> [(latency_seconds, ok)]
+        clients = [_HttpClient(url.hostname, url.port or 80, options['timeout']) for _ in range(options['clients'])]
+        names, weights = list(mix), list(mix.values())
+
+        async def drive(client):
+            try:
+                while time.monotonic() < deadline:
+                    endpoint = rng.choices(names, weights)[0]
+                    reg_number = rng.choice(students)
+                    if endpoint == 'unit_registration' and not client.logged_in:
+                        await self.hit(client, 'student_login', reg_number, course_id, samples)
+                    await self.hit(client, endpoint, reg_number, course_id, samples)
+            finally:
+                await client.close()
+
+        await asyncio.gather(*(drive(client) for client in clients))
+        return samples
+
+    async def hit(self, client, endpoint, reg_number, course_id, samples):
+        # Form posts need the CSRF cookie first (not timed, like a page already open in the browser)
+        if endpoint in ('student_login', 'unit_registration') and 'csrftoken' not in client.cookies:
+            try:
+                await client.request('GET', reverse('student_login'))
+            except REQUEST_ERRORS:
+                await client.close()
+
+        csrf = {'csrfmiddlewaretoken': client.cookies.get('csrftoken', '')}
+        if endpoint == 'check_seat':
+            method, path, form = 'GET', reverse('check_seat') + '?' + urlencode({'reg_number': reg_number}), None
+        elif endpoint == 'student_exam_slip':
+            method, path, form = 'GET', quote(reverse('student_exam_slip', args=[reg_number])), None
+        elif endpoint == 'student_login':
+            method, path = 'POST', reverse('student_login')
+            form = {**csrf, 'reg_number': reg_number, 'password': LOAD_PASSWORD}
+        else:
+            method, path, form = 'POST', reverse('unit_registration'), {**csrf, 'courses': [course_id]}
+
+        started = time.perf_counter()
+        try:
+            status = await client.request(method, path, form)
+            ok = status == EXPECTED_STATUS[endpoint]
+        except REQUEST_ERRORS:
+            await client.close()
+            ok = False
+        samples[endpoint].append((time.perf_counter() - started, ok))
+
+        if endpoint == 'student_login':
+            client.logged_in = ok
+
+    def build_report(self, samples, elapsed, options, mix):
+        endpoints = {}
+        for name, results in samples.items():
+            latencies = sorted(latency * 1000 for latency, _ in results)
+            errors = sum(1 for _, ok in results if not ok)
+            endpoints[name] = {
+                'requests': len(results),
+                'errors': errors,
+                'error_rate': round(errors / len(results), 4) if results else 0.0,
+                'throughput_rps': round(len(results) / elapsed, 2),
+                'latency_ms': {
+                    'p50': self.round_ms(_percentile(latencies, 50)),
+                    'p95': self.round_ms(_percentile(latencies, 95)),
+                    'p99': self.round_ms(_percentile(latencies, 99)),
+                    'max': self.round_ms(latencies[-1] if latencies else None),
+                },
+            }
+
+        total_requests = sum(stats['requests'] for stats in endpoints.values())
+        total_errors = sum(stats['errors'] for stats in endpoints.values())
+        return {
+            'config': {
+                'url': options['url'],
+                'clients': options['clients'],
+                'duration_s': options['duration'],
+                'mix': mix,
+            },
+            'elapsed_s': round(elapsed, 2),
+            'total': {
+                'requests': total_requests,
+                'errors': total_errors,
+                'error_rate': round(total_errors / total_requests, 4) if total_requests else 0.0,
+                'throughput_rps': round(total_requests / elapsed, 2),
+            },
+            'endpoints': endpoints,
+        }
+
+    def round_ms(self, value):
+        return round(value, 2) if value is not None else None
+
+    def compare(self, baseline, report):
+        """Per-endpoint change in throughput and p95 against an earlier report (positive = higher now)."""
+        changes = {}
+        for name, stats in report['endpoints'].items():
+            before = baseline.get('endpoints', {}).get(name)
+            if not before:
+                continue
+            p95_now, p95_before = stats['latency_ms']['p95'], before['latency_ms']['p95']
+            changes[name] = {
+                'throughput_rps': round(stats['throughput_rps'] - before['throughput_rps'], 2),
+                'p95_ms': round(p95_now - p95_before, 2) if p95_now is not None and p95_before is not None else None,
+                'error_rate': round(stats['error_rate'] - before['error_rate'], 4),
+            }
+        return changes
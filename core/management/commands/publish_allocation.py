@@ -0,0 +1,55 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from core.models import AllocationSnapshot, Exam
+
+class Command(BaseCommand):
+    help = 'Lists, publishes or rolls back the saved allocation versions of an exam'
+
+    def add_arguments(self, parser):
+        parser.add_argument('exam_id', type=int, help='ID of the exam')
+        group = parser.add_mutually_exclusive_group()
+        group.add_argument('--to-version', type=int, help='Version number to make live')
+        group.add_argument('--previous', action='store_true', help='Roll back to the version before the live one')
+        parser.add_argument('--notify', action='store_true', help='Email students their seat in the version made live')
+
+    def handle(self, *args, **options):
+        exam_id = options['exam_id']
+
+        try:
+            exam = Exam.objects.select_related('published_snapshot').get(id=exam_id)
+        except Exam.DoesNotExist:
+            self.stdout.write(self.style.ERROR(f'Exam ID {exam_id} not found!'))
+            return
+
+        snapshots = AllocationSnapshot.objects.filter(exam=exam).defer('seats')
+        live = exam.published_snapshot
+
+        # 1. No option: just show what we have
+        if options['to_version'] is None and not options['previous']:
+            for snapshot in snapshots:
+                marker = ' (live)' if snapshot.pk == exam.published_snapshot_id else ''
+                self.stdout.write(
+                    f"v{snapshot.version}: {snapshot.seat_count} seats, {snapshot.created_at:%Y-%m-%d %H:%M}{marker}"
+                )
+            return
+
+        # 2. Find the target version
+        if options['previous']:
+            older = snapshots.filter(version__lt=live.version) if live else snapshots.none()
+            target = older.first()  # Newest first (model ordering)
+            if target is None:
+                self.stdout.write(self.style.ERROR(f'No earlier version to roll back to for {exam}.'))
+                return
+        else:
+            target = snapshots.filter(version=options['to_version']).first()
+            if target is None:
+                self.stdout.write(self.style.ERROR(f"Version {options['to_version']} not found for {exam}."))
+                return
+
+        # 3. Switch the pointer
+        target.publish()
+        self.stdout.write(self.style.SUCCESS(f'Version {target.version} of {exam} is now live.'))
+
+        # 4. Publishing queued the seat emails; send them now if asked
+        if options['notify']:
+            call_command('send_seat_notifications', exam=exam.id, stdout=self.stdout)
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from core.notifications import deliver_pending, live_pending, retry_failed
+
+class Command(BaseCommand):
+    help = 'Emails students their room and seat for every published allocation not yet notified'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exam', type=int, help='Only this exam ID (default: all exams)')
+        parser.add_argument('--workers', type=int, default=4, help='Parallel senders, each with its own mail connection')
+        parser.add_argument('--batch-size', type=int, default=100, help='Messages per claimed batch')
+        parser.add_argument('--retry-failed', action='store_true', help='Queue failed and stuck messages again first')
+
+    def handle(self, *args, **options):
+        exam_id = options['exam']
+
+        if options['retry_failed']:
+            requeued = retry_failed(exam_id)
+            self.stdout.write(f"Re-queued {requeued} failed messages.")
+
+        pending = live_pending(exam_id).count()
+        if not pending:
+            self.stdout.write(self.style.SUCCESS('Nothing to send. Everyone has been notified.'))
+            return
+
+        self.stdout.write(f"Sending {pending} seat notifications with {options['workers']} workers...")
+        totals = deliver_pending(exam_id, workers=options['workers'], batch_size=options['batch_size'])
+
+        self.stdout.write(self.style.SUCCESS(f"Sent {totals['sent']} notifications."))
+        if totals['failed']:
+            self.stdout.write(self.style.WARNING(
+                f"{totals['failed']} failed. Fix the cause and rerun with --retry-failed."
+            ))
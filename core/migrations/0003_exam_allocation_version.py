@@ -0,0 +1,23 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_rename_title_course_name_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exam',
+            name='allocation_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exam',
+            name='allocation_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:09
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_exam_allocation_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AllocationSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveIntegerField()),
+                ('seats', models.BinaryField()),
+                ('seat_count', models.PositiveIntegerField(default=0)),
+                ('is_materialized', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='core.exam')),
+            ],
+            options={
+                'ordering': ('exam', '-version'),
+                'unique_together': {('exam', 'version')},
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='seatassignment',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='exam',
+            name='published_snapshot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.allocationsnapshot'),
+        ),
+        migrations.AddField(
+            model_name='seatassignment',
+            name='snapshot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='assignments', to='core.allocationsnapshot'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_seat_notifications'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CheckIn',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('checked_in_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkins', to='core.exam')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.room')),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.student')),
+            ],
+            options={
+                'unique_together': {('exam', 'student')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_checkin'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='blocked_seats',
+            field=models.TextField(blank=True, help_text='Seat labels nobody may use, e.g. "A1, C12"'),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='columns',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='rows',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
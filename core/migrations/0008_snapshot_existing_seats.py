@@ -0,0 +1,53 @@
+# Existing seats become a published version 1 of their exam. Kept apart from
+# the schema changes in 0004 and the unique constraint in 0009: on Postgres,
+# filling the new foreign key and altering the same table in one transaction
+# fails with "pending trigger events".
+
+import struct
+import sys
+import zlib
+from array import array
+
+from django.db import migrations
+
+
+def pack_seats(rows):
+    """Frozen copy of core.snapshots.pack_seats, so later format changes can't break this migration."""
+    rows = list(rows)
+    student_ids = array('q', (row[0] for row in rows))
+    room_ids = array('q', (row[1] for row in rows))
+    if sys.byteorder == 'big':
+        student_ids.byteswap()
+        room_ids.byteswap()
+    seat_numbers = '\n'.join(str(row[2]) for row in rows).encode('utf-8')
+    raw = struct.pack('<I', len(rows)) + student_ids.tobytes() + room_ids.tobytes() + seat_numbers
+    return zlib.compress(raw)
+
+
+def snapshot_existing_seats(apps, schema_editor):
+    """Wraps each exam's seats that have no version yet in a new published version."""
+    Exam = apps.get_model('core', 'Exam')
+    AllocationSnapshot = apps.get_model('core', 'AllocationSnapshot')
+    SeatAssignment = apps.get_model('core', 'SeatAssignment')
+
+    exam_ids = SeatAssignment.objects.filter(snapshot__isnull=True).values_list('exam_id', flat=True).distinct()
+    for exam in Exam.objects.filter(pk__in=list(exam_ids)):
+        assignments = SeatAssignment.objects.filter(exam=exam, snapshot__isnull=True)
+        rows = list(assignments.order_by('id').values_list('student_id', 'room_id', 'seat_number'))
+        last = AllocationSnapshot.objects.filter(exam=exam).order_by('-version').values_list('version', flat=True).first()
+        snapshot = AllocationSnapshot.objects.create(
+            exam=exam, version=(last or 0) + 1, seats=pack_seats(rows), seat_count=len(rows), is_materialized=True
+        )
+        assignments.update(snapshot=snapshot)
+        Exam.objects.filter(pk=exam.pk).update(published_snapshot=snapshot)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_room_layout'),
+    ]
+
+    operations = [
+        migrations.RunPython(snapshot_existing_seats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_snapshot_existing_seats'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='seatassignment',
+            unique_together={('snapshot', 'student')},
+        ),
+    ]
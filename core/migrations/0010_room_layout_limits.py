@@ -0,0 +1,29 @@
+# Generated by Django 5.0.1 on 2026-10-19 17:39
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_seatassignment_snapshot_unique'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='room',
+            name='capacity',
+            field=models.IntegerField(help_text='Worked out from the layout when rows and columns are set'),
+        ),
+        migrations.AlterField(
+            model_name='room',
+            name='columns',
+            field=models.PositiveSmallIntegerField(default=0, validators=[django.core.validators.MaxValueValidator(200)]),
+        ),
+        migrations.AlterField(
+            model_name='room',
+            name='rows',
+            field=models.PositiveSmallIntegerField(default=0, validators=[django.core.validators.MaxValueValidator(200)]),
+        ),
+    ]
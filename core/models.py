@@ -1,4 +1,14 @@
-from django.db import models
+import threading
+
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator
+from django.db import models, transaction
+from django.db.models import F, Max, OuterRef, Q, Subquery
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from .seating import MAX_GRID_SIDE, RoomGrid, parse_blocked, seat_label
+from .snapshots import pack_seats, unpack_seats
 
 class Course(models.Model):
     # I changed 'title' to 'name' so it works with your templates ({{ course.name }})
@@ -32,9 +42,37 @@ class Student(models.Model):
 
 class Room(models.Model):
     name = models.CharField(max_length=20)
-    capacity = models.IntegerField()
+    capacity = models.IntegerField(help_text='Worked out from the layout when rows and columns are set')
     is_accessible = models.BooleanField(default=False)
 
+    # --- SEATING LAYOUT (optional) ---
+    # With rows and columns set, seats are labelled "A1".."C12" and the
+    # capacity is worked out from the grid minus the blocked seats.
+    rows = models.PositiveSmallIntegerField(default=0, validators=[MaxValueValidator(MAX_GRID_SIDE)])
+    columns = models.PositiveSmallIntegerField(default=0, validators=[MaxValueValidator(MAX_GRID_SIDE)])
+    blocked_seats = models.TextField(blank=True, help_text='Seat labels nobody may use, e.g. "A1, C12"')
+
+    @property
+    def has_layout(self):
+        return bool(self.rows and self.columns)
+
+    def clean(self):
+        if bool(self.rows) != bool(self.columns):
+            raise ValidationError('Set both rows and columns, or neither.')
+        try:
+            blocked = parse_blocked(self.blocked_seats)
+        except ValueError as e:
+            raise ValidationError({'blocked_seats': str(e)})
+        if self.has_layout:
+            outside = [seat_label(row, column) for row, column in blocked if row >= self.rows or column >= self.columns]
+            if outside:
+                raise ValidationError({'blocked_seats': f"Not in a {self.rows} x {self.columns} room: {', '.join(outside)}"})
+
+    def save(self, *args, **kwargs):
+        if self.has_layout:
+            self.capacity = RoomGrid.from_room(self).usable_seats()
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.name} (Cap: {self.capacity})"
 
@@ -42,22 +80,317 @@ class Exam(models.Model):
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
     date_time = models.DateTimeField()
     duration_minutes = models.IntegerField()
+
+    # Bumped every time this exam's SeatAssignment set changes.
+    # The staff reports use it for ETags and their rendered-page cache.
+    allocation_version = models.PositiveIntegerField(default=0)
+    allocation_updated_at = models.DateTimeField(null=True, blank=True)
+
+    # The AllocationSnapshot students currently see. Publishing or rolling
+    # back is just pointing this somewhere else.
+    published_snapshot = models.ForeignKey(
+        'AllocationSnapshot', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
     
     # Note: We removed 'registered_students' from here.
     # Why? Because we now use the 'enrolled_courses' on the Student model.
     # This is smarter: If a student is in the Course, they are automatically in the Exam.
 
+    def bump_allocation_version(self):
+        """Marks the seating as changed (one UPDATE, safe with concurrent writers)."""
+        Exam.objects.filter(pk=self.pk).update(
+            allocation_version=F('allocation_version') + 1,
+            allocation_updated_at=timezone.now(),
+        )
+
+    def live_snapshot(self):
+        """Returns the published snapshot, publishing an empty one if the exam was never allocated."""
+        # This instance may predate the last publish (it is only a pointer update)
+        self.refresh_from_db(fields=['published_snapshot'])
+        if self.published_snapshot_id is None:
+            AllocationSnapshot.record(self, []).publish()
+            self.refresh_from_db(fields=['published_snapshot'])
+        return self.published_snapshot
+
     def __str__(self):
         return f"{self.course.code} Exam on {self.date_time.strftime('%Y-%m-%d %H:%M')}"
 
+class AllocationSnapshot(models.Model):
+    """One allocate run for one exam, kept so it can be published or rolled back to later."""
+    # Trade-off: publishing a version bulk-inserts its rows into SeatAssignment
+    # (once, if they aren't there yet), and the previous versions keep theirs so
+    # a rollback is only a pointer switch. That means student reads filter on
+    # exam.published_snapshot_id, and the table holds up to this many older
+    # versions next to the live one. Older snapshots keep only their blob;
+    # their rows are bulk-deleted and re-inserted if someone rolls back that far.
+    KEEP_MATERIALIZED = 3
+
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name='snapshots')
+    version = models.PositiveIntegerField()
+    seats = models.BinaryField()  # Packed (student, room, seat) rows, see core/snapshots.py
+    seat_count = models.PositiveIntegerField(default=0)
+    is_materialized = models.BooleanField(default=False)  # Rows exist in SeatAssignment
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('exam', 'version')
+        ordering = ('exam', '-version')
+
+    @classmethod
+    def record(cls, exam, rows):
+        """Stores (student_id, room_id, seat_number) rows as the exam's next version."""
+        with transaction.atomic():
+            # Lock the exam row so two allocate runs can't take the same version
+            Exam.objects.select_for_update().filter(pk=exam.pk).exists()
+            last = cls.objects.filter(exam=exam).aggregate(Max('version'))['version__max'] or 0
+            return cls.objects.create(
+                exam=exam, version=last + 1, seats=pack_seats(rows), seat_count=len(rows)
+            )
+
+    def rows(self):
+        return unpack_seats(self.seats)
+
+    def repack(self):
+        """Rebuilds the blob from this version's rows after hand edits, so a rollback brings them back."""
+        rows = list(self.assignments.order_by('id').values_list('student_id', 'room_id', 'seat_number'))
+        AllocationSnapshot.objects.filter(pk=self.pk).update(seats=pack_seats(rows), seat_count=len(rows))
+
+    def materialize(self):
+        """Inserts this version's SeatAssignment rows. They stay invisible until published."""
+        with transaction.atomic():
+            locked = AllocationSnapshot.objects.select_for_update().get(pk=self.pk)
+            if not locked.is_materialized:
+                rows = locked.rows()
+                # Students or rooms deleted since this version was pruned lose their seat
+                student_ids = set(Student.objects.filter(pk__in={row[0] for row in rows}).values_list('pk', flat=True))
+                room_ids = set(Room.objects.filter(pk__in={row[1] for row in rows}).values_list('pk', flat=True))
+                SeatAssignment.objects.bulk_create(
+                    [
+                        SeatAssignment(exam_id=self.exam_id, snapshot=self, student_id=student_id,
+                                       room_id=room_id, seat_number=seat_number)
+                        for student_id, room_id, seat_number in rows
+                        if student_id in student_ids and room_id in room_ids
+                    ],
+                    batch_size=1000,
+                )
+                AllocationSnapshot.objects.filter(pk=self.pk).update(is_materialized=True)
+        self.is_materialized = True
+
+    def publish(self):
+        """Makes this version live with a single UPDATE of exam.published_snapshot."""
+        self.materialize()
+        Exam.objects.filter(pk=self.exam_id).update(
+            published_snapshot=self,
+            allocation_version=F('allocation_version') + 1,
+            allocation_updated_at=timezone.now(),
+        )
+        self.prune_older()
+        self.queue_notifications()
+
+    def queue_notifications(self):
+        """
+        Adds a pending seat email per student. Students whose latest email already
+        describes this version are skipped.
+        """
+        pending_elsewhere = SeatNotification.objects.filter(
+            snapshot__exam_id=self.exam_id, status=SeatNotification.PENDING
+        ).exclude(snapshot=self)
+        pending_elsewhere.update(status=SeatNotification.SUPERSEDED)
+
+        SeatNotification.objects.bulk_create(
+            [
+                SeatNotification(snapshot=self, student_id=student_id)
+                for student_id in self.assignments.values_list('student_id', flat=True)
+            ],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+        # Rolled back: emails cancelled earlier, and students whose last email
+        # described another version, must hear about this one (again)
+        last_sent_snapshot = (
+            SeatNotification.objects.filter(
+                snapshot__exam_id=self.exam_id, student_id=OuterRef('student_id'), status=SeatNotification.SENT
+            )
+            .order_by('-sent_at', '-id')
+            .values('snapshot_id')[:1]
+        )
+        outdated = (
+            SeatNotification.objects.filter(snapshot=self, status=SeatNotification.SENT)
+            .annotate(last_sent_snapshot=Subquery(last_sent_snapshot))
+            .exclude(last_sent_snapshot=self.pk)
+        )
+        SeatNotification.objects.filter(
+            Q(status=SeatNotification.SUPERSEDED) | Q(pk__in=outdated.values('pk')), snapshot=self
+        ).update(status=SeatNotification.PENDING, claim='')
+
+    def prune_older(self):
+        """Drops the rows (not the blobs) of old versions nobody is looking at."""
+        live_id = Exam.objects.filter(pk=self.exam_id).values_list('published_snapshot_id', flat=True).first()
+        stale = (
+            AllocationSnapshot.objects.filter(exam_id=self.exam_id, is_materialized=True)
+            .exclude(pk=live_id)
+            .order_by('-version')[self.KEEP_MATERIALIZED:]
+        )
+        for snapshot in stale:
+            with transaction.atomic():
+                # Flagged first, so the delete signals don't re-pack the blob from zero rows
+                AllocationSnapshot.objects.filter(pk=snapshot.pk).update(is_materialized=False)
+                SeatAssignment.objects.filter(snapshot=snapshot).delete()
+
+    def __str__(self):
+        return f"Exam {self.exam_id} v{self.version}"
+
+class SeatAssignmentQuerySet(models.QuerySet):
+    def published(self):
+        """Only rows of each exam's published snapshot (what students should see)."""
+        return self.filter(snapshot__isnull=False, snapshot_id=F('exam__published_snapshot_id'))
+
 class SeatAssignment(models.Model):
     exam = models.ForeignKey(Exam, on_delete=models.CASCADE)
     student = models.ForeignKey(Student, on_delete=models.CASCADE)
     room = models.ForeignKey(Room, on_delete=models.CASCADE)
     seat_number = models.CharField(max_length=10) # Using CharField allows "A1" or "10"
+    # Which allocation version this row belongs to. Only rows of
+    # exam.published_snapshot are live, see SeatAssignment.objects.published().
+    snapshot = models.ForeignKey(
+        AllocationSnapshot, on_delete=models.CASCADE, null=True, blank=True, related_name='assignments'
+    )
+
+    objects = SeatAssignmentQuerySet.as_manager()
     
     class Meta:
-        unique_together = ('exam', 'student') # A student cannot have two seats for the same exam
-        
+        unique_together = ('snapshot', 'student') # A student cannot have two seats in the same allocation
+
+    # Edits and deletes (admin, shell, cascades) bump the exam version and re-pack the
+    # snapshot blob through seating_changed(). bulk_create skips both, so bulk writers
+    # must call exam.bump_allocation_version() themselves.
+    def save(self, *args, **kwargs):
+        previous = None
+        if self.pk is not None:
+            previous = (
+                SeatAssignment.objects.filter(pk=self.pk)
+                .values_list('exam_id', 'snapshot_id', 'student_id', 'room_id', 'seat_number').first()
+            )
+        if self.snapshot_id is None or (previous is not None and previous[0] != self.exam_id):
+            # Hand-made seats, and seats moved to another exam, go into that exam's live version
+            self.snapshot = self.exam.live_snapshot()
+        super().save(*args, **kwargs)
+        # Moving a seat to another exam or version changes both, so both get bumped / re-packed
+        exam_ids, snapshot_ids = {self.exam_id}, {self.snapshot_id}
+        if previous is not None:
+            exam_ids.add(previous[0])
+            snapshot_ids.add(previous[1])
+        seating_changed(exam_ids, snapshot_ids - {None})
+
+        # A student given a new seat in the live version gets a (new) seat email
+        if previous is None or previous[2:] != (self.student_id, self.room_id, str(self.seat_number)):
+            if Exam.objects.filter(pk=self.exam_id, published_snapshot_id=self.snapshot_id).exists():
+                SeatNotification.objects.update_or_create(
+                    snapshot_id=self.snapshot_id, student_id=self.student_id,
+                    defaults={'status': SeatNotification.PENDING, 'claim': ''},
+                )
+
+    def __str__(self):
+        return f"{self.student} -> {self.room} Seat {self.seat_number}"
+
+@receiver(post_delete, sender=SeatAssignment)
+def seat_assignment_deleted(sender, instance, **kwargs):
+    """Runs for single deletes, queryset deletes and cascades (e.g. a Student or Room deleted)."""
+    seating_changed({instance.exam_id}, {instance.snapshot_id} - {None})
+
+# Exams and snapshots whose seats changed in the current transaction. A cascade
+# sends one post_delete per row; collecting the ids turns that into one
+# re-pack per snapshot and one UPDATE for the exams when it commits.
+_seating_changes = threading.local()
+
+def seating_changed(exam_ids, snapshot_ids=()):
+    if not hasattr(_seating_changes, 'exam_ids'):
+        _seating_changes.exam_ids, _seating_changes.snapshot_ids = set(), set()
+    _seating_changes.exam_ids.update(exam_ids)
+    _seating_changes.snapshot_ids.update(snapshot_ids)
+    transaction.on_commit(_flush_seating_changes)
+
+def _flush_seating_changes():
+    exam_ids, _seating_changes.exam_ids = _seating_changes.exam_ids, set()
+    snapshot_ids, _seating_changes.snapshot_ids = _seating_changes.snapshot_ids, set()
+    # Pruned versions (rows dropped on purpose) are skipped: their blob is already right
+    for snapshot in AllocationSnapshot.objects.filter(pk__in=snapshot_ids, is_materialized=True).defer('seats'):
+        snapshot.repack()
+    if exam_ids:
+        Exam.objects.filter(pk__in=exam_ids).update(
+            allocation_version=F('allocation_version') + 1,
+            allocation_updated_at=timezone.now(),
+        )
+
+# Names printed on the staff reports and check-in packs, which are cached per
+# allocation version. Renaming one bumps the exams that show it. Bulk
+# queryset.update() renames skip this and must bump the exams themselves.
+REPORTED_NAMES = {
+    Student: ('registration_number', 'first_name', 'last_name'),
+    Room: ('name',),
+    Course: ('code', 'name'),
+}
+
+def remember_reported_names(sender, instance, **kwargs):
+    if instance.pk is not None:
+        instance._reported_names = sender.objects.filter(pk=instance.pk).values_list(*REPORTED_NAMES[sender]).first()
+
+def reported_names_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_reported_names', None)
+    if created or previous is None:
+        return
+    if previous == tuple(getattr(instance, field) for field in REPORTED_NAMES[sender]):
+        return
+    if sender is Course:
+        exams = Exam.objects.filter(course=instance)
+    elif sender is Room:
+        exams = Exam.objects.filter(seatassignment__room=instance)
+    else:
+        exams = Exam.objects.filter(seatassignment__student=instance)
+    seating_changed(set(exams.values_list('id', flat=True)))
+
+for _model in REPORTED_NAMES:
+    pre_save.connect(remember_reported_names, sender=_model)
+    post_save.connect(reported_names_saved, sender=_model)
+
+class SeatNotification(models.Model):
+    """Delivery state of one seat email, so reruns of the sender skip what already went out."""
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    SUPERSEDED = 'superseded'  # A newer version was published before this one was sent
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+        (SUPERSEDED, 'Superseded'),
+    ]
+
+    snapshot = models.ForeignKey(AllocationSnapshot, on_delete=models.CASCADE, related_name='notifications')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    status = models.CharField(max_length=12, choices=STATUS_CHOICES, default=PENDING, db_index=True)
+    claim = models.CharField(max_length=32, blank=True)  # Which sender batch owns a 'sending' row
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('snapshot', 'student') # One email per student per allocation version
+
+    def __str__(self):
+        return f"{self.student_id} @ {self.snapshot}: {self.status}"
+
+class CheckIn(models.Model):
+    """A student scanned in at the exam room door."""
+    exam = models.ForeignKey(Exam, on_delete=models.CASCADE, related_name='checkins')
+    student = models.ForeignKey(Student, on_delete=models.CASCADE)
+    room = models.ForeignKey(Room, on_delete=models.CASCADE)
+    checked_in_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('exam', 'student') # Scanning twice keeps the first check-in
+
     def __str__(self):
-        return f"{self.student} -> {self.room} Seat {self.seat_number}"
\ No newline at end of file
+        return f"{self.student_id} in {self.room_id} at {self.checked_in_at:%H:%M}"
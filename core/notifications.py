@@ -0,0 +1,185 @@
+"""
+Seat email fan-out.
+
+Publishing an allocation queues one SeatNotification per student
+(AllocationSnapshot.queue_notifications). deliver_pending() then sends them
+from a pool of worker threads. Each worker keeps one mail connection
+open for all of its batches and records the results with one UPDATE per
+batch. The admin's publish actions start that in the background
+(deliver_in_background); from the shell use `allocate --notify`,
+`publish_allocation --notify` or `send_seat_notifications`.
+"""
+import logging
+import queue
+import threading
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection as db_connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import SeatAssignment, SeatNotification
+
+logger = logging.getLogger(__name__)
+
+
+def live_pending(exam_id=None):
+    """Pending notifications that belong to the version students currently see."""
+    pending = SeatNotification.objects.filter(
+        status=SeatNotification.PENDING,
+        snapshot_id=F('snapshot__exam__published_snapshot_id'),
+    )
+    if exam_id is not None:
+        pending = pending.filter(snapshot__exam_id=exam_id)
+    return pending
+
+
+def retry_failed(exam_id=None):
+    """Puts failed (and stuck 'sending') notifications of live versions back in the queue."""
+    stuck = SeatNotification.objects.filter(
+        status__in=[SeatNotification.FAILED, SeatNotification.SENDING],
+        snapshot_id=F('snapshot__exam__published_snapshot_id'),
+    )
+    if exam_id is not None:
+        stuck = stuck.filter(snapshot__exam_id=exam_id)
+    return stuck.update(status=SeatNotification.PENDING, claim='')
+
+
+def build_message(notification, assignment):
+    student = notification.student
+    exam = notification.snapshot.exam
+    when = timezone.localtime(exam.date_time).strftime('%A %d %B %Y, %H:%M')
+    body = (
+        f"Hello {student.first_name},\n\n"
+        f"Your seat for {exam.course.code} - {exam.course.name} is ready.\n\n"
+        f"Date: {when}\n"
+        f"Room: {assignment.room.name}\n"
+        f"Seat: {assignment.seat_number}\n\n"
+        f"Bring your exam docket (Registration No. {student.registration_number}).\n"
+        f"KCA University Examinations"
+    )
+    return EmailMessage(
+        subject=f"Exam seat: {exam.course.code} - {assignment.room.name} seat {assignment.seat_number}",
+        body=body,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[student.email],
+    )
+
+
+def _claim(ids):
+    """Marks a batch as ours so a second sender running at the same time can't send it too."""
+    token = uuid.uuid4().hex
+    SeatNotification.objects.filter(id__in=ids, status=SeatNotification.PENDING).update(
+        status=SeatNotification.SENDING, claim=token, attempts=F('attempts') + 1
+    )
+    return list(
+        SeatNotification.objects.filter(claim=token, status=SeatNotification.SENDING)
+        .select_related('student', 'snapshot__exam__course')
+    )
+
+
+def _send_batch(mail_connection, batch):
+    seats = {
+        (seat.snapshot_id, seat.student_id): seat
+        for seat in SeatAssignment.objects.filter(
+            snapshot_id__in={n.snapshot_id for n in batch},
+            student_id__in={n.student_id for n in batch},
+        ).select_related('room')
+    }
+
+    sent_ids, failures = [], []
+    for notification in batch:
+        assignment = seats.get((notification.snapshot_id, notification.student_id))
+        if assignment is None:
+            failures.append((notification.id, 'No seat in this allocation version.'))
+            continue
+        if not notification.student.email:
+            failures.append((notification.id, 'Student has no email address.'))
+            continue
+        try:
+            if mail_connection.send_messages([build_message(notification, assignment)]):
+                sent_ids.append(notification.id)
+            else:
+                failures.append((notification.id, 'Mail backend did not accept the message.'))
+        except Exception as e:
+            failures.append((notification.id, str(e)))
+
+    SeatNotification.objects.filter(id__in=sent_ids).update(
+        status=SeatNotification.SENT, sent_at=timezone.now(), last_error='', claim=''
+    )
+    for notification_id, error in failures:
+        SeatNotification.objects.filter(id=notification_id).update(
+            status=SeatNotification.FAILED, last_error=error, claim=''
+        )
+    return len(sent_ids), len(failures)
+
+
+def deliver_pending(exam_id=None, workers=4, batch_size=100):
+    """Sends every live pending notification. Returns a Counter of 'sent' and 'failed'."""
+    totals = Counter(sent=0, failed=0)
+    ids = list(live_pending(exam_id).order_by('id').values_list('id', flat=True))
+    if not ids:
+        return totals
+    batches = queue.Queue()
+    for start in range(0, len(ids), batch_size):
+        batches.put(ids[start:start + batch_size])
+
+    totals_lock = threading.Lock()
+    errors = []
+
+    def worker():
+        mail_connection = get_connection(fail_silently=False)
+        try:
+            # Opened once here, so send_messages() reuses it instead of reconnecting per batch
+            mail_connection.open()
+            while True:
+                try:
+                    batch_ids = batches.get_nowait()
+                except queue.Empty:
+                    return
+                batch = _claim(batch_ids)
+                if batch:
+                    sent, failed = _send_batch(mail_connection, batch)
+                    with totals_lock:
+                        totals['sent'] += sent
+                        totals['failed'] += failed
+        except Exception as e:
+            # e.g. the SMTP server refused us: stop this worker, report it below
+            errors.append(e)
+        finally:
+            mail_connection.close()
+            db_connection.close()  # Each thread has its own DB connection
+
+    threads = [threading.Thread(target=worker) for _ in range(max(1, min(workers, batches.qsize())))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors and not totals['sent'] + totals['failed']:
+        raise errors[0]
+    return totals
+
+
+def deliver_in_background(exam_ids):
+    """
+    Sends the live pending emails of these exams on a background thread once the
+    current transaction commits, so a publish from the admin emails students
+    without holding up the request. If the process dies halfway, rows left in
+    'sending' are picked up by `send_seat_notifications --retry-failed`.
+    """
+    exam_ids = list(exam_ids)
+
+    def run():
+        try:
+            for exam_id in exam_ids:
+                totals = deliver_pending(exam_id)
+                logger.info("Seat emails for exam %s: %s sent, %s failed", exam_id, totals['sent'], totals['failed'])
+        except Exception:
+            logger.exception("Sending seat emails for exams %s failed", exam_ids)
+        finally:
+            db_connection.close()
+
+    transaction.on_commit(lambda: threading.Thread(target=run, daemon=True).start())
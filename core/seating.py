@@ -0,0 +1,197 @@
+"""
+Grid seating engine.
+
+A room with a layout is a rows x columns grid kept in one bytearray
+(0 = free, 255 = blocked, n = taken by exam group n). Concurrent exams
+are interleaved on a colour pattern ((row + column) % k). Seats side by
+side or front to back always have different colours, so any mix of exams
+can share one colour without two classmates touching. The pattern is
+written a whole row at a time with slice assignment. Exams are packed onto
+the colours biggest first, and a second pass fills the remaining seats,
+checking the four neighbours of each one. With three or more exams both a
+checkerboard (k = 2) and one colour per exam (k = exams) are tried, and
+whichever seats more students wins: the checkerboard suits one big exam
+with small ones, k colours suits exams of similar size.
+
+Seats are labelled row letter + column number: "A1", "C12", ..., "AA3".
+"""
+import re
+import string
+
+FREE = 0
+BLOCKED = 255
+MAX_GROUPS = 254
+MAX_GRID_SIDE = 200  # Rows or columns in one room; keeps a grid well under a megabyte
+
+_LABEL = re.compile(r'^([A-Z]+)(\d+)$')
+
+
+def row_letters(row):
+    """0 -> 'A', 25 -> 'Z', 26 -> 'AA' (spreadsheet style)."""
+    letters = ''
+    row += 1
+    while row:
+        row, remainder = divmod(row - 1, 26)
+        letters = string.ascii_uppercase[remainder] + letters
+    return letters
+
+
+def seat_label(row, column):
+    return f"{row_letters(row)}{column + 1}"
+
+
+def parse_label(label):
+    """'C12' -> (2, 11). Raises ValueError for anything else."""
+    match = _LABEL.match(label.strip().upper())
+    if not match:
+        raise ValueError(f"'{label}' is not a seat label like 'C12'.")
+    letters, number = match.groups()
+    row = 0
+    for letter in letters:
+        row = row * 26 + (ord(letter) - ord('A') + 1)
+    return row - 1, int(number) - 1
+
+
+def parse_blocked(text):
+    """'A3, C12' -> [(0, 2), (2, 11)]"""
+    return [parse_label(label) for label in re.split(r'[\s,;]+', text or '') if label]
+
+
+class RoomGrid:
+    """The seats of one room as a flat bytearray, row by row."""
+
+    def __init__(self, rows, columns, blocked=(), plain_numbers=False):
+        self.rows = rows
+        self.columns = columns
+        self.plain_numbers = plain_numbers  # Label seats "1", "2", ... instead of "A1"
+        self.cells = bytearray(rows * columns)
+        for row, column in blocked:
+            if 0 <= row < rows and 0 <= column < columns:
+                self.cells[row * columns + column] = BLOCKED
+
+    @classmethod
+    def from_room(cls, room):
+        """Rooms without a layout become one long row of `capacity` seats."""
+        if room.rows and room.columns:
+            return cls(room.rows, room.columns, parse_blocked(room.blocked_seats))
+        return cls(1, max(room.capacity, 0), plain_numbers=True)
+
+    def copy(self):
+        grid = RoomGrid(self.rows, self.columns, plain_numbers=self.plain_numbers)
+        grid.cells[:] = self.cells
+        return grid
+
+    def label(self, index):
+        if self.plain_numbers:
+            return str(index + 1)  # Same numbering as before layouts existed
+        return seat_label(*divmod(index, self.columns))
+
+    def usable_seats(self):
+        return len(self.cells) - self.cells.count(BLOCKED)
+
+    def free_indices(self):
+        return [index for index, cell in enumerate(self.cells) if cell == FREE]
+
+    def touches(self, index, group):
+        """True if a seat in front, behind, left or right is taken by `group`."""
+        cells, columns = self.cells, self.columns
+        column = index % columns
+        return (
+            (column > 0 and cells[index - 1] == group)
+            or (column < columns - 1 and cells[index + 1] == group)
+            or (index >= columns and cells[index - columns] == group)
+            or (index + columns < len(cells) and cells[index + columns] == group)
+        )
+
+    def colour_pattern(self, k):
+        """(row + column) % k + 1 for every seat, one slice assignment per row."""
+        base = bytes(column % k + 1 for column in range(self.columns + k))
+        pattern = bytearray(len(self.cells))
+        for row in range(self.rows):
+            shift = row % k
+            pattern[row * self.columns:(row + 1) * self.columns] = base[shift:shift + self.columns]
+        return pattern
+
+
+def seat_labels(room):
+    """Labels of the room's usable seats, front row first."""
+    grid = RoomGrid.from_room(room)
+    return [grid.label(index) for index in grid.free_indices()]
+
+
+def seat_groups(grid, groups):
+    """
+    Seats several exam groups (lists of students, in priority order) in one room.
+
+    Returns (placements, leftovers): placements[g] is a list of (student, label)
+    and leftovers[g] the students of group g that did not fit without touching
+    a classmate. A single group is simply seated in row order.
+    """
+    k = len(groups)
+    if k > MAX_GROUPS:
+        raise ValueError(f"At most {MAX_GROUPS} exams can share a room.")
+    queues = [list(group) for group in groups]
+
+    if k == 1:
+        seats = grid.free_indices()[:len(queues[0])]
+        for index in seats:
+            grid.cells[index] = 1
+        return [[(student, grid.label(index)) for student, index in zip(queues[0], seats)]], [queues[0][len(seats):]]
+
+    # Try each pattern on a copy and keep whichever seats the most students
+    best = None
+    for colours in ([2, k] if k > 2 else [2]):
+        trial = grid.copy()
+        trial_placements, cursors = _interleave(trial, queues, colours)
+        if best is None or sum(cursors) > sum(best[2]):
+            best = (trial, trial_placements, cursors)
+    trial, placements, cursors = best
+    grid.cells[:] = trial.cells
+
+    # Seats were collected as indices; hand them back in seat order with labels
+    labelled = [
+        [(student, grid.label(index)) for student, index in sorted(group, key=lambda item: item[1])]
+        for group in placements
+    ]
+    leftovers = [queue[cursor:] for queue, cursor in zip(queues, cursors)]
+    return labelled, leftovers
+
+
+def _interleave(grid, queues, colours):
+    """
+    Packs the groups onto a `colours`-colour pattern of `grid` (changed in place).
+    Returns (placements, cursors): (student, seat index) pairs per group and
+    how many of each group's queue were seated.
+    """
+    # 1. Interleave: biggest exams first, each onto the colour with the most seats left
+    pattern = grid.colour_pattern(colours)
+    free = grid.free_indices()
+    by_colour = {colour: [] for colour in range(1, colours + 1)}
+    for index in free:
+        by_colour[pattern[index]].append(index)
+
+    placements = [[] for _ in queues]
+    cursors = [0] * len(queues)
+    used = dict.fromkeys(by_colour, 0)
+    for g in sorted(range(len(queues)), key=lambda g: -len(queues[g])):
+        colour = max(by_colour, key=lambda c: len(by_colour[c]) - used[c])
+        seats = by_colour[colour][used[colour]:used[colour] + len(queues[g])]
+        used[colour] += len(seats)
+        for index in seats:
+            grid.cells[index] = g + 1
+            placements[g].append((queues[g][cursors[g]], index))
+            cursors[g] += 1
+
+    # 2. Uneven groups: bigger groups take the seats smaller ones left,
+    # as long as no classmate sits next to them
+    for index in free:
+        if grid.cells[index] != FREE:
+            continue
+        for g in range(len(queues)):
+            if cursors[g] < len(queues[g]) and not grid.touches(index, g + 1):
+                grid.cells[index] = g + 1
+                placements[g].append((queues[g][cursors[g]], index))
+                cursors[g] += 1
+                break
+
+    return placements, cursors
@@ -0,0 +1,52 @@
+"""
+Compact storage for allocation snapshots.
+
+One allocate run produces a list of (student_id, room_id, seat_number) rows.
+We keep it as a single zlib-compressed blob:
+
+    [count: uint32][student ids: int64 * count][room ids: int64 * count][seat numbers: "\\n"-joined utf-8]
+
+so every old version costs a few bytes per student instead of a full table row.
+"""
+import struct
+import sys
+import zlib
+from array import array
+
+_HEADER = struct.Struct('<I')
+
+
+def _to_little_endian(ids):
+    if sys.byteorder == 'big':
+        ids.byteswap()
+    return ids.tobytes()
+
+
+def pack_seats(rows):
+    """Packs (student_id, room_id, seat_number) rows into bytes."""
+    rows = list(rows)
+    student_ids = array('q', (row[0] for row in rows))
+    room_ids = array('q', (row[1] for row in rows))
+    seat_numbers = '\n'.join(str(row[2]) for row in rows).encode('utf-8')
+    raw = _HEADER.pack(len(rows)) + _to_little_endian(student_ids) + _to_little_endian(room_ids) + seat_numbers
+    return zlib.compress(raw)
+
+
+def unpack_seats(blob):
+    """Returns the (student_id, room_id, seat_number) rows stored by pack_seats()."""
+    raw = zlib.decompress(bytes(blob))  # Postgres hands back a memoryview
+    (count,) = _HEADER.unpack_from(raw)
+    offset = _HEADER.size
+    width = count * 8
+
+    student_ids = array('q')
+    student_ids.frombytes(raw[offset:offset + width])
+    room_ids = array('q')
+    room_ids.frombytes(raw[offset + width:offset + 2 * width])
+    if sys.byteorder == 'big':
+        student_ids.byteswap()
+        room_ids.byteswap()
+
+    text = raw[offset + 2 * width:].decode('utf-8')
+    seat_numbers = text.split('\n') if count else []
+    return list(zip(student_ids, room_ids, seat_numbers))
@@ -1,3 +1,577 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+from contextlib import redirect_stdout
+from datetime import timedelta
+from importlib import import_module
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .checkin import make_code, scan_time
+from .models import AllocationSnapshot, CheckIn, Course, Exam, Room, SeatAssignment, SeatNotification, Student
+from .seating import RoomGrid, parse_blocked, parse_label, row_letters, seat_groups, seat_label
+from .snapshots import pack_seats, unpack_seats
+
+
+def same_exam_neighbours(grid):
+    """Seats whose neighbour in front, behind, left or right sits the same exam."""
+    return [
+        index for index, cell in enumerate(grid.cells)
+        if cell not in (0, 255) and grid.touches(index, cell)
+    ]
+
+
+def students(prefix, count):
+    return [f"{prefix}{number}" for number in range(count)]
+
+
+class SeatLabelTests(SimpleTestCase):
+    def test_row_letters(self):
+        self.assertEqual([row_letters(row) for row in (0, 25, 26, 27, 701, 702)], ['A', 'Z', 'AA', 'AB', 'ZZ', 'AAA'])
+
+    def test_label_round_trip(self):
+        for row in range(0, 800, 7):
+            for column in (0, 9, 41):
+                self.assertEqual(parse_label(seat_label(row, column)), (row, column))
+
+    def test_parse_label_is_forgiving_about_case_and_spaces(self):
+        self.assertEqual(parse_label(' c12 '), (2, 11))
+
+    def test_parse_label_rejects_other_text(self):
+        for text in ('', '12', 'C', 'C-12', '1C'):
+            with self.assertRaises(ValueError):
+                parse_label(text)
+
+    def test_parse_blocked(self):
+        self.assertEqual(parse_blocked('A3, C12;B1\nAA2'), [(0, 2), (2, 11), (1, 0), (26, 1)])
+        self.assertEqual(parse_blocked(''), [])
+        self.assertEqual(parse_blocked(None), [])
+
+
+class RoomGridTests(SimpleTestCase):
+    def test_blocked_seats_are_not_usable(self):
+        grid = RoomGrid(3, 4, blocked=[(0, 0), (2, 3), (9, 9)])
+        self.assertEqual(grid.usable_seats(), 10)
+        self.assertNotIn(0, grid.free_indices())
+        self.assertEqual(grid.label(5), 'B2')
+
+    def test_plain_numbers(self):
+        grid = RoomGrid(1, 5, plain_numbers=True)
+        self.assertEqual([grid.label(index) for index in grid.free_indices()], ['1', '2', '3', '4', '5'])
+
+    def test_colour_pattern_never_repeats_next_to_itself(self):
+        for k in (2, 3, 5):
+            grid = RoomGrid(7, 9)
+            grid.cells[:] = grid.colour_pattern(k)
+            self.assertEqual(same_exam_neighbours(grid), [])
+            self.assertEqual(set(grid.cells), set(range(1, k + 1)))
+
+
+class SeatGroupsTests(SimpleTestCase):
+    def assertSeatsEveryone(self, rows, columns, sizes, blocked=()):
+        grid = RoomGrid(rows, columns, blocked)
+        groups = [students(f"E{number}-", size) for number, size in enumerate(sizes)]
+        placements, leftovers = seat_groups(grid, groups)
+
+        self.assertEqual([len(placed) for placed in placements], sizes)
+        self.assertEqual(leftovers, [[] for _ in sizes])
+        self.assertEqual(same_exam_neighbours(grid), [])
+        labels = [label for placed in placements for _, label in placed]
+        self.assertEqual(len(labels), len(set(labels)))
+        for row, column in blocked:
+            self.assertNotIn(seat_label(row, column), labels)
+        return placements
+
+    def test_single_exam_fills_rows_in_order(self):
+        grid = RoomGrid(2, 3)
+        placements, leftovers = seat_groups(grid, [students('S', 4)])
+        self.assertEqual([label for _, label in placements[0]], ['A1', 'A2', 'A3', 'B1'])
+        self.assertEqual(leftovers, [[]])
+
+    def test_two_exams_on_a_checkerboard(self):
+        self.assertSeatsEveryone(10, 10, [50, 50])
+
+    def test_three_similar_exams_use_three_colours(self):
+        # A checkerboard would leave a third of the third exam standing
+        self.assertSeatsEveryone(25, 40, [330, 330, 330])
+
+    def test_one_big_exam_with_small_ones(self):
+        self.assertSeatsEveryone(25, 40, [500, 300, 150], blocked=[(0, 1), (3, 4)])
+
+    def test_students_keep_their_priority_order(self):
+        placements = self.assertSeatsEveryone(6, 6, [10, 8])
+        for group, placed in zip(('E0-', 'E1-'), placements):
+            seated = {student for student, _ in placed}
+            self.assertEqual(seated, set(students(group, len(placed))))
+
+    def test_leftovers_when_the_room_is_too_small(self):
+        grid = RoomGrid(4, 4)
+        placements, leftovers = seat_groups(grid, [students('A', 10), students('B', 10)])
+        self.assertEqual(sum(map(len, placements)) + sum(map(len, leftovers)), 20)
+        self.assertEqual(same_exam_neighbours(grid), [])
+        self.assertEqual(leftovers[0], students('A', 10)[len(placements[0]):])
+
+    def test_too_many_groups(self):
+        with self.assertRaises(ValueError):
+            seat_groups(RoomGrid(1, 1), [['x']] * 255)
+
+
+class SnapshotPackingTests(SimpleTestCase):
+    def test_round_trip(self):
+        rows = [(1, 10, '1'), (2**40, 3, 'C12'), (7, 7, 'Ü9')]
+        self.assertEqual(unpack_seats(pack_seats(rows)), rows)
+
+    def test_empty(self):
+        self.assertEqual(unpack_seats(pack_seats([])), [])
+
+    def test_memoryview_from_postgres(self):
+        rows = [(5, 6, 'A1')]
+        self.assertEqual(unpack_seats(memoryview(pack_seats(rows))), rows)
+
+    def test_seat_numbers_are_stored_as_text(self):
+        self.assertEqual(unpack_seats(pack_seats([(1, 2, 3)])), [(1, 2, '3')])
+
+    def test_frozen_migration_packer_matches(self):
+        migration = import_module('core.migrations.0008_snapshot_existing_seats')
+        rows = [(1, 10, '1'), (2, 3, 'C12')]
+        self.assertEqual(unpack_seats(migration.pack_seats(rows)), rows)
+
+
+class SeatingDataMixin:
+    """A course with `STUDENTS` enrolled students, two rooms and one exam, allocated by the real command."""
+    STUDENTS = 6
+
+    def setUp(self):
+        cache.clear()  # Report and roster caches are keyed on ids, which tests reuse
+        self.course = Course.objects.create(code='BIT 111', name='Intro to Programming')
+        self.rooms = [Room.objects.create(name='LAB 1', capacity=4), Room.objects.create(name='LAB 2', capacity=4)]
+        self.students = [
+            Student.objects.create(
+                registration_number=f'KCA/{number:03d}', first_name='Ann', last_name=f'Student {number}',
+                email=f'kca{number}@example.invalid',
+            )
+            for number in range(self.STUDENTS)
+        ]
+        for student in self.students:
+            student.enrolled_courses.add(self.course)
+        self.exam = Exam.objects.create(course=self.course, date_time=timezone.now() + timedelta(days=1), duration_minutes=120)
+        self.staff = User.objects.create_user('invigilator', password='pw', is_staff=True)
+
+    def allocate(self, exam=None, *args):
+        call_command('allocate', (exam or self.exam).id, *args, stdout=io.StringIO())
+
+    def version(self, exam=None):
+        return Exam.objects.values_list('allocation_version', flat=True).get(pk=(exam or self.exam).pk)
+
+
+class AllocationVersionTests(SeatingDataMixin, TestCase):
+    def test_reports_answer_304_until_the_seating_changes(self):
+        self.allocate()
+        self.client.force_login(self.staff)
+        for name in ('print_sheet', 'door_lists'):
+            url = reverse(name, args=[self.exam.id])
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            self.assertContains(first, 'KCA/000')
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+            seat = SeatAssignment.objects.published().filter(exam=self.exam).first()
+            seat.seat_number = 'Z9'
+            with self.captureOnCommitCallbacks(execute=True):
+                seat.save()
+            changed = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(changed.status_code, 200)
+            self.assertNotEqual(changed['ETag'], first['ETag'])
+            self.assertContains(changed, 'Z9')
+
+    def test_repeat_report_loads_come_from_the_cache(self):
+        self.allocate()
+        self.client.force_login(self.staff)
+        url = reverse('print_sheet', args=[self.exam.id])
+        self.client.get(url)
+        with self.assertNumQueries(5):  # Session, user, Last-Modified, ETag, exam; no seat query
+            self.client.get(url)
+
+    def test_cascade_delete_bumps_once(self):
+        self.allocate()
+        before = self.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rooms[0].delete()
+        self.assertEqual(self.version(), before + 1)
+
+    def test_moving_a_seat_bumps_both_exams(self):
+        other = Exam.objects.create(course=self.course, date_time=self.exam.date_time, duration_minutes=60)
+        self.allocate()
+        before, other_before = self.version(), self.version(other)
+        seat = SeatAssignment.objects.published().filter(exam=self.exam).first()
+        seat.exam = other
+        with self.captureOnCommitCallbacks(execute=True):
+            seat.save()
+        self.assertGreater(self.version(), before)
+        self.assertGreater(self.version(other), other_before)
+
+    def test_renames_bump_the_version(self):
+        self.allocate()
+        for obj, field in ((self.rooms[0], 'name'), (self.students[0], 'last_name'), (self.course, 'name')):
+            before = self.version()
+            setattr(obj, field, 'Renamed')
+            with self.captureOnCommitCallbacks(execute=True):
+                obj.save()
+            self.assertEqual(self.version(), before + 1, field)
+
+    def test_saving_without_a_rename_keeps_the_version(self):
+        self.allocate()
+        before = self.version()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.students[0].save()  # e.g. unit_registration
+        self.assertEqual(self.version(), before)
+
+    def test_checkin_pack_etag_depends_on_encoding_and_room(self):
+        self.allocate()
+        self.client.force_login(self.staff)
+        url = reverse('checkin_pack', args=[self.exam.id, self.rooms[0].id])
+        zipped = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        plain = self.client.get(url)
+        other_room = self.client.get(reverse('checkin_pack', args=[self.exam.id, self.rooms[1].id]))
+        self.assertEqual(zipped['Content-Encoding'], 'gzip')
+        self.assertEqual(len({zipped['ETag'], plain['ETag'], other_room['ETag']}), 3)
+        for response in (zipped, plain):
+            self.assertIn('Accept-Encoding', response['Vary'])
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=plain['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertIn('Accept-Encoding', not_modified['Vary'])
+
+
+class AllocationSnapshotTests(SeatingDataMixin, TestCase):
+    def live_rows(self, exam=None):
+        return set(
+            SeatAssignment.objects.published().filter(exam=exam or self.exam)
+            .values_list('student_id', 'room_id', 'seat_number')
+        )
+
+    def snapshot(self, version):
+        return AllocationSnapshot.objects.get(exam=self.exam, version=version)
+
+    def test_allocate_publishes_a_new_version(self):
+        self.allocate()
+        self.allocate()
+        self.exam.refresh_from_db()
+        self.assertEqual(self.exam.published_snapshot, self.snapshot(2))
+        self.assertEqual(len(self.live_rows()), self.STUDENTS)
+        # The old version's rows are kept for a quick rollback, but not live
+        self.assertEqual(SeatAssignment.objects.filter(exam=self.exam).count(), 2 * self.STUDENTS)
+
+    def test_no_publish_keeps_the_live_version(self):
+        self.allocate()
+        self.allocate(None, '--no-publish')
+        self.exam.refresh_from_db()
+        self.assertEqual(self.exam.published_snapshot.version, 1)
+        self.assertFalse(self.snapshot(2).is_materialized)
+
+    def test_rollback_to_a_pruned_version(self):
+        self.allocate()
+        first = self.live_rows()
+        for _ in range(AllocationSnapshot.KEEP_MATERIALIZED + 1):
+            self.allocate()
+        self.assertFalse(self.snapshot(1).is_materialized)
+        self.assertFalse(SeatAssignment.objects.filter(snapshot=self.snapshot(1)).exists())
+
+        call_command('publish_allocation', self.exam.id, '--to-version', '1', stdout=io.StringIO())
+        self.assertEqual(self.live_rows(), first)
+
+    def test_previous_goes_back_one_version(self):
+        self.allocate()
+        self.allocate()
+        call_command('publish_allocation', self.exam.id, '--previous', stdout=io.StringIO())
+        self.exam.refresh_from_db()
+        self.assertEqual(self.exam.published_snapshot.version, 1)
+
+    def test_hand_edits_survive_prune_and_rollback(self):
+        self.allocate()
+        seat = SeatAssignment.objects.published().get(exam=self.exam, student=self.students[0])
+        seat.seat_number = 'Z99'
+        with self.captureOnCommitCallbacks(execute=True):
+            seat.save()
+        self.assertIn((self.students[0].id, seat.room_id, 'Z99'), self.snapshot(1).rows())
+
+        for _ in range(AllocationSnapshot.KEEP_MATERIALIZED + 1):
+            self.allocate()
+        call_command('publish_allocation', self.exam.id, '--to-version', '1', stdout=io.StringIO())
+        self.assertIn((self.students[0].id, seat.room_id, 'Z99'), self.live_rows())
+
+    def test_hand_added_seat_joins_the_live_version(self):
+        self.allocate()
+        newcomer = Student.objects.create(registration_number='KCA/999', first_name='New', last_name='Comer')
+        stale_exam = Exam.objects.get(pk=self.exam.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            SeatAssignment.objects.create(exam=stale_exam, student=newcomer, room=self.rooms[1], seat_number='9')
+        self.assertEqual(len(self.live_rows()), self.STUDENTS + 1)
+        self.assertEqual(self.snapshot(1).seat_count, self.STUDENTS + 1)
+
+    def test_moving_a_seat_to_another_exam_keeps_it_live(self):
+        other = Exam.objects.create(course=self.course, date_time=self.exam.date_time + timedelta(days=1), duration_minutes=60)
+        self.allocate()
+        self.allocate(other)
+        seat = SeatAssignment.objects.published().filter(exam=self.exam).exclude(student=self.students[0]).first()
+        SeatAssignment.objects.published().filter(exam=other, student=seat.student).delete()
+
+        seat.exam = other
+        with self.captureOnCommitCallbacks(execute=True):
+            seat.save()
+        seat.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(seat.snapshot, other.published_snapshot)
+        self.assertEqual(len(self.live_rows()), self.STUDENTS - 1)
+        self.assertEqual(len(self.live_rows(other)), self.STUDENTS)
+        self.assertEqual(self.snapshot(1).seat_count, self.STUDENTS - 1)
+        self.assertEqual(other.published_snapshot.seat_count, self.STUDENTS)
+
+    def test_admin_form_does_not_offer_snapshots(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.invalid', 'pw'))
+        response = self.client.get(reverse('admin:core_seatassignment_add'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'name="snapshot"')  # Shown read-only, not as a <select>
+
+
+@override_settings(SEAT_API_KEYS=['kiosk-key'])
+class SeatApiTests(SeatingDataMixin, TestCase):
+    STUDENTS = 8
+    KEY = {'HTTP_AUTHORIZATION': 'Api-Key kiosk-key'}
+
+    def setUp(self):
+        super().setUp()
+        self.allocate()
+
+    def lookup(self, regs, **headers):
+        return self.client.post(
+            reverse('seat_lookup_api'), json.dumps({'registration_numbers': regs}),
+            content_type='application/json', **headers,
+        )
+
+    def test_batch_lookup_is_one_query_whatever_the_size(self):
+        regs = [student.registration_number for student in self.students] + ['KCA/NOPE']
+        for size in (2, len(regs)):
+            with self.assertNumQueries(1):
+                response = self.lookup(regs[:size], **self.KEY)
+            self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(len(data['results']), self.STUDENTS)
+        self.assertEqual(data['not_found'], ['KCA/NOPE'])
+        self.assertEqual(data['results']['KCA/000'][0]['exam'], self.exam.id)
+
+    def test_small_batches_are_public(self):
+        response = self.client.get(reverse('seat_lookup_api'), {'reg': ['kca/001', 'KCA/002']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(response.json()['results']), ['KCA/001', 'KCA/002'])
+
+    def test_big_batches_need_a_key_or_staff(self):
+        regs = [student.registration_number for student in self.students]
+        self.assertEqual(self.lookup(regs).status_code, 401)
+        self.assertEqual(self.lookup(regs, HTTP_AUTHORIZATION='Api-Key wrong').status_code, 401)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.lookup(regs).status_code, 200)
+
+    def test_unpublished_versions_are_not_served(self):
+        self.allocate(None, '--no-publish')
+        response = self.lookup(['KCA/000'])
+        self.assertEqual(len(response.json()['results']['KCA/000']), 1)
+
+    def test_exam_roster_needs_a_key_or_staff(self):
+        url = reverse('exam_seats_api', args=[self.exam.id])
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(self.client.get(url, HTTP_AUTHORIZATION='Api-Key wrong').status_code, 401)
+        self.assertEqual(self.client.get(url, **self.KEY).status_code, 200)
+
+    def test_exam_roster_pages_with_a_cursor(self):
+        url = reverse('exam_seats_api', args=[self.exam.id])
+        seen, cursor = [], 0
+        while cursor is not None:
+            response = self.client.get(url, {'cursor': cursor, 'limit': 3}, HTTP_ACCEPT_ENCODING='gzip', **self.KEY)
+            body = b''.join(response.streaming_content)
+            if response.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+            page = json.loads(body)
+            seen += [row['reg'] for row in page['results']]
+            cursor = page['next_cursor']
+        self.assertEqual(sorted(seen), sorted(student.registration_number for student in self.students))
+
+    def test_bad_requests(self):
+        self.assertEqual(self.lookup('KCA/000').status_code, 400)
+        response = self.client.post(reverse('seat_lookup_api'), 'not json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        url = reverse('exam_seats_api', args=[self.exam.id])
+        self.assertEqual(self.client.get(url, {'limit': 'x'}, **self.KEY).status_code, 400)
+
+
+# The sender's worker threads use their own connections, so the data must be committed
+class SeatNotificationTests(SeatingDataMixin, TransactionTestCase):
+    def statuses(self):
+        return sorted(SeatNotification.objects.values_list('status', flat=True))
+
+    def send(self, *args):
+        call_command('send_seat_notifications', *args, stdout=io.StringIO())
+
+    def test_one_email_per_student_and_reruns_send_nothing(self):
+        self.allocate(None, '--notify')
+        self.assertEqual(len(mail.outbox), self.STUDENTS)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), sorted(s.email for s in self.students))
+        self.send()
+        self.assertEqual(len(mail.outbox), self.STUDENTS)
+        self.assertEqual(self.statuses(), [SeatNotification.SENT] * self.STUDENTS)
+
+    def test_newer_version_supersedes_unsent_emails(self):
+        self.allocate()
+        self.allocate()
+        self.send()
+        self.assertEqual(len(mail.outbox), self.STUDENTS)
+        latest = Exam.objects.get(pk=self.exam.pk).published_snapshot
+        self.assertFalse(SeatNotification.objects.filter(status=SeatNotification.SENT).exclude(snapshot=latest).exists())
+
+    def test_rollback_tells_students_again(self):
+        self.allocate(None, '--notify')
+        Room.objects.create(name='HALL', capacity=50)  # v2 moves everyone into the hall
+        self.allocate(None, '--notify')
+        self.assertTrue(all('HALL' in message.subject for message in mail.outbox[self.STUDENTS:]))
+
+        call_command('publish_allocation', self.exam.id, '--previous', '--notify', stdout=io.StringIO())
+        rollback_emails = mail.outbox[2 * self.STUDENTS:]
+        self.assertEqual(len(rollback_emails), self.STUDENTS)
+        self.assertFalse(any('HALL' in message.subject for message in rollback_emails))
+
+        # Publishing the live version again changes nothing for the students
+        call_command('publish_allocation', self.exam.id, '--to-version', '1', '--notify', stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 3 * self.STUDENTS)
+
+    def test_failures_can_be_retried(self):
+        Student.objects.filter(pk=self.students[0].pk).update(email='')
+        self.allocate(None, '--notify')
+        failed = SeatNotification.objects.get(status=SeatNotification.FAILED)
+        self.assertEqual(failed.student_id, self.students[0].id)
+
+        Student.objects.filter(pk=self.students[0].pk).update(email='fixed@example.invalid')
+        self.send('--retry-failed')
+        self.assertEqual(self.statuses(), [SeatNotification.SENT] * self.STUDENTS)
+        self.assertEqual(mail.outbox[-1].to, ['fixed@example.invalid'])
+
+    def test_hand_added_seat_is_emailed(self):
+        self.allocate(None, '--notify')
+        newcomer = Student.objects.create(registration_number='KCA/999', first_name='New', last_name='Comer', email='new@example.invalid')
+        SeatAssignment.objects.create(exam=self.exam, student=newcomer, room=self.rooms[1], seat_number='9')
+        self.send()
+        self.assertEqual(mail.outbox[-1].to, ['new@example.invalid'])
+
+    def test_admin_publish_actions_start_sending(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.invalid', 'pw'))
+        with mock.patch('core.admin.deliver_in_background') as deliver, redirect_stdout(io.StringIO()):
+            self.client.post(
+                reverse('admin:core_exam_changelist'),
+                {'action': 'run_allocation', '_selected_action': [self.exam.id]},
+            )
+        deliver.assert_called_once_with([self.exam.id])
+        self.assertEqual(SeatNotification.objects.filter(status=SeatNotification.PENDING).count(), self.STUDENTS)
+
+
+class CheckInTests(SeatingDataMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Exam.objects.filter(pk=self.exam.pk).update(date_time=timezone.now())  # Starting now
+        self.exam.refresh_from_db()
+        self.allocate()
+        self.client.force_login(self.staff)
+        self.seats = {
+            seat.student.registration_number: seat
+            for seat in SeatAssignment.objects.published().filter(exam=self.exam).select_related('student')
+        }
+        self.here = self.rooms[0]
+
+    def sync(self, scans, room=None):
+        url = reverse('checkin_sync', args=[self.exam.id, (room or self.here).id])
+        return self.client.post(url, json.dumps({'scans': scans}), content_type='application/json')
+
+    def reg_in(self, room):
+        return next(reg for reg, seat in self.seats.items() if seat.room_id == room.id)
+
+    def test_statuses(self):
+        mine, elsewhere = self.reg_in(self.here), self.reg_in(self.rooms[1])
+        outsider = Student.objects.create(registration_number='KCA/999', first_name='No', last_name='Seat')
+        scans = [
+            {'code': make_code(mine)},
+            {'code': make_code(mine)},
+            {'code': make_code(elsewhere)},
+            {'code': make_code(outsider.registration_number)},
+            {'code': f'{mine}:forged'},
+            {'code': 42},
+        ]
+        response = self.sync(scans)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']],
+            ['ok', 'already_checked_in', 'wrong_room', 'not_seated', 'invalid', 'invalid'],
+        )
+        self.assertEqual(list(CheckIn.objects.values_list('student__registration_number', flat=True)), [mine])
+        # A later batch still knows who is in
+        self.assertEqual(self.sync([{'code': make_code(mine)}]).json()['results'][0]['status'], 'already_checked_in')
+
+    def test_bad_times_do_not_break_the_sync(self):
+        regs = [reg for reg, seat in self.seats.items() if seat.room_id == self.here.id]
+        body = '{"scans": [%s]}' % ', '.join(
+            '{"code": "%s", "at": %s}' % (make_code(reg), at)
+            for reg, at in zip(regs, ['1e20', 'NaN', str(10 ** 400), '"yesterday"'])
+        )
+        before = timezone.now()
+        response = self.client.post(
+            reverse('checkin_sync', args=[self.exam.id, self.here.id]), body, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(CheckIn.objects.filter(checked_in_at__gte=before).count(), len(regs))
+
+    def test_scan_time_is_clamped(self):
+        now = timezone.now()
+        earliest = self.exam.date_time - timedelta(days=1)
+        for at in (1e20, float('nan'), float('inf'), 10 ** 400, -10 ** 400, 'soon', None, True):
+            self.assertGreaterEqual(scan_time(self.exam, at), now, at)
+        for at in (-5, 0):
+            self.assertAlmostEqual(scan_time(self.exam, at).timestamp(), earliest.timestamp(), places=3)
+
+    def test_offline_time_is_kept(self):
+        reg = self.reg_in(self.here)
+        at = timezone.now() - timedelta(minutes=30)
+        self.sync([{'code': make_code(reg), 'at': at.timestamp() * 1000}])
+        self.assertAlmostEqual(CheckIn.objects.get().checked_in_at.timestamp(), at.timestamp(), places=2)
+
+    def test_malformed_batches_are_rejected(self):
+        url = reverse('checkin_sync', args=[self.exam.id, self.here.id])
+        self.assertEqual(self.client.post(url, 'nope', content_type='application/json').status_code, 400)
+        self.assertEqual(self.sync(['not an object']).status_code, 400)
+
+    def test_pack_lists_only_this_room(self):
+        response = self.client.get(reverse('checkin_pack', args=[self.exam.id, self.here.id]))
+        seats = response.json()['seats']
+        self.assertEqual(set(seats), {reg for reg, seat in self.seats.items() if seat.room_id == self.here.id})
+
+
+class RoomLayoutTests(TestCase):
+    def test_capacity_comes_from_the_layout(self):
+        room = Room.objects.create(name='HALL', capacity=999, rows=3, columns=4, blocked_seats='A1, C4')
+        self.assertEqual(room.capacity, 10)
+
+    def test_layout_limits(self):
+        for rows, columns, blocked in ((32767, 10, ''), (10, 201, ''), (3, 0, ''), (2, 2, 'C1'), (2, 2, 'oops')):
+            room = Room(name='BAD', capacity=1, rows=rows, columns=columns, blocked_seats=blocked)
+            with self.assertRaises(ValidationError, msg=(rows, columns, blocked)):
+                room.full_clean()
+
+    def test_admin_capacity_is_read_only_with_a_layout(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.invalid', 'pw'))
+        grid = Room.objects.create(name='HALL', capacity=0, rows=3, columns=4)
+        plain = Room.objects.create(name='LAB', capacity=30)
+        self.assertNotContains(self.client.get(reverse('admin:core_room_change', args=[grid.id])), 'name="capacity"')
+        self.assertContains(self.client.get(reverse('admin:core_room_change', args=[plain.id])), 'name="capacity"')
@@ -1,12 +1,27 @@
 # --- 1. IMPORTS ---
 import io
+import gzip
+import json
 import base64
+import hmac
 import qrcode
+from django.conf import settings
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import condition, require_GET, require_http_methods
+from django.template.loader import render_to_string
+from django.core.cache import cache
+from django.views.decorators.cache import cache_control
+from django.views.decorators.vary import vary_on_headers
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
 from django.contrib import messages
-from .models import Exam, SeatAssignment, Student, Course
+from .models import Exam, SeatAssignment, Student, Course, Room
+from .checkin import make_code, record_scans, room_pack
 
 # --- 2. SECURITY HELPER ---
 def is_staff(user):
@@ -23,7 +38,7 @@ def check_seat(request):
     error = None
     if query:
         # We just check if they exist in ANY seat to validate them
-        assignment = SeatAssignment.objects.filter(student__registration_number=query).first()
+        assignment = SeatAssignment.objects.published().filter(student__registration_number=query).first()
         if not assignment:
             error = f"No seat found for {query}. Have you registered for units?"
     return render(request, 'check_seat.html', {'assignment': assignment, 'error': error})
@@ -33,7 +48,7 @@ def student_exam_slip(request, reg_number):
     """Generates a Master Docket with ALL Units."""
     
     # 1. Get ALL assignments for this student (ordered by date)
-    assignments = SeatAssignment.objects.filter(student__registration_number=reg_number).order_by('exam__date_time')
+    assignments = SeatAssignment.objects.published().filter(student__registration_number=reg_number).order_by('exam__date_time')
     
     # 2. Get the student details (Check if student exists even if no exams yet)
     student = Student.objects.filter(registration_number=reg_number).first()
@@ -41,8 +56,8 @@ def student_exam_slip(request, reg_number):
     if not student:
          return render(request, 'check_seat.html', {'error': "Student not found!"})
 
-    # 3. Generate ONE Master QR Code (Student Identity)
-    qr_data = f"Student: {student.registration_number} | {student.first_name} {student.last_name}"
+    # 3. Generate ONE Master QR Code (Signed Student Identity, scanned at the exam room door)
+    qr_data = make_code(student.registration_number)
     
     qr = qrcode.QRCode(version=1, box_size=10, border=5)
     qr.add_data(qr_data)
@@ -162,16 +177,212 @@ def unit_registration(request):
     })
 
 # --- 5. STAFF REPORTS ---
+# Rendered reports are cached per allocation version, so a new
+# allocate run simply makes the old entries unreachable.
+REPORT_CACHE_SECONDS = 60 * 60 * 24
+
+def _report_etag(request, exam_id, **kwargs):
+    version = Exam.objects.filter(id=exam_id).values_list('allocation_version', flat=True).first()
+    if version is None:
+        return None
+    return f"exam-{exam_id}-v{version}"
+
+def _report_last_modified(request, exam_id, **kwargs):
+    return Exam.objects.filter(id=exam_id).values_list('allocation_updated_at', flat=True).first()
+
+def _render_exam_report(request, exam_id, template_name):
+    exam = get_object_or_404(Exam.objects.select_related('course'), id=exam_id)
+    cache_key = f"exam-report:{template_name}:{exam.id}:v{exam.allocation_version}"
+    html = cache.get(cache_key)
+    if html is None:
+        # Read the snapshot we versioned the cache key with, even if a publish lands meanwhile
+        assignments = (
+            SeatAssignment.objects.filter(exam=exam, snapshot_id=exam.published_snapshot_id)
+            .select_related('student', 'room')
+            .order_by('room__name', 'seat_number')
+        )
+        html = render_to_string(template_name, {'exam': exam, 'assignments': assignments}, request=request)
+        cache.set(cache_key, html, REPORT_CACHE_SECONDS)
+    return HttpResponse(html)
+
 @login_required
 @user_passes_test(is_staff)
+@cache_control(private=True, max_age=0, must_revalidate=True)
+@condition(etag_func=_report_etag, last_modified_func=_report_last_modified)
 def exam_attendance_sheet(request, exam_id):
-    exam = get_object_or_404(Exam, id=exam_id)
-    assignments = SeatAssignment.objects.filter(exam=exam).order_by('room__name', 'seat_number')
-    return render(request, 'attendance_sheet.html', {'exam': exam, 'assignments': assignments})
+    return _render_exam_report(request, exam_id, 'attendance_sheet.html')
 
 @login_required
 @user_passes_test(is_staff)
+@cache_control(private=True, max_age=0, must_revalidate=True)
+@condition(etag_func=_report_etag, last_modified_func=_report_last_modified)
 def room_door_lists(request, exam_id):
+    return _render_exam_report(request, exam_id, 'door_lists.html')
+
+# --- 6. SEAT LOOKUP API (Kiosks + SMS Gateway) ---
+# Read-only JSON. Every request costs a fixed number of queries, whatever the batch size.
+API_MAX_BATCH = 1000
+# Anonymous callers may look up this many reg numbers at once (a student checking
+# a few friends). Bigger batches would let anyone rebuild whole rosters.
+API_PUBLIC_BATCH = 5
+API_PAGE_SIZE = 500
+API_MAX_PAGE_SIZE = 5000
+
+def _has_roster_access(request):
+    """Staff sessions, or kiosks and gateways sending "Authorization: Api-Key <key>"."""
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+    return scheme == 'Api-Key' and any(
+        hmac.compare_digest(key.strip().encode(), allowed.encode()) for allowed in settings.SEAT_API_KEYS
+    )
+
+def _local_iso(value):
+    return timezone.localtime(value).isoformat() if value else None
+
+@csrf_exempt
+@gzip_page
+@require_http_methods(['GET', 'POST'])
+def seat_lookup_api(request):
+    """
+    GET  /api/seats/?reg=KCA/050&reg=KCA/051
+    POST /api/seats/  {"registration_numbers": ["KCA/050", ...]}
+    Anyone may ask about a few reg numbers; bigger batches need staff login or an API key.
+    """
+    if request.method == 'POST':
+        try:
+            reg_numbers = json.loads(request.body or b'{}').get('registration_numbers', [])
+        except (ValueError, AttributeError):
+            return JsonResponse({'error': 'Body must be JSON like {"registration_numbers": [...]}'}, status=400)
+    else:
+        reg_numbers = request.GET.getlist('reg')
+
+    if not isinstance(reg_numbers, list) or not all(isinstance(reg, str) for reg in reg_numbers):
+        return JsonResponse({'error': 'registration_numbers must be a list of strings.'}, status=400)
+    # Reg numbers are stored upper-case (see student_signup)
+    wanted = {reg.strip().upper() for reg in reg_numbers if reg.strip()}
+    if len(wanted) > API_MAX_BATCH:
+        return JsonResponse({'error': f'At most {API_MAX_BATCH} registration numbers per request.'}, status=400)
+    if len(wanted) > API_PUBLIC_BATCH and not _has_roster_access(request):
+        return JsonResponse(
+            {'error': f'Batches over {API_PUBLIC_BATCH} registration numbers need staff login or an API key.'},
+            status=401,
+        )
+
+    rows = (
+        SeatAssignment.objects.published()
+        .filter(student__registration_number__in=wanted)
+        .order_by('student__registration_number', 'exam__date_time')
+        .values_list(
+            'student__registration_number', 'exam_id', 'exam__course__code',
+            'exam__date_time', 'room__name', 'seat_number',
+        )
+    )
+    results = {}
+    for reg, exam_id, course_code, date_time, room, seat in rows:
+        results.setdefault(reg, []).append({
+            'exam': exam_id, 'course': course_code, 'at': _local_iso(date_time), 'room': room, 'seat': seat,
+        })
+
+    return JsonResponse({'results': results, 'not_found': sorted(wanted - results.keys())})
+
+@gzip_page
+@require_GET
+def exam_seats_api(request, exam_id):
+    """
+    GET /api/exams/<exam_id>/seats/?cursor=<next_cursor>&limit=500
+    Streams one page of the exam's published seating, ordered by id.
+    Whole rosters are for staff and API-key holders only; students use seat_lookup_api.
+    """
+    if not _has_roster_access(request):
+        return JsonResponse({'error': 'Staff login or an API key is required.'}, status=401)
+    try:
+        cursor = int(request.GET.get('cursor', 0))
+        limit = min(int(request.GET.get('limit', API_PAGE_SIZE)), API_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'cursor and limit must be integers.'}, status=400)
+    if limit < 1:
+        return JsonResponse({'error': 'limit must be at least 1.'}, status=400)
+
+    exam = get_object_or_404(Exam.objects.select_related('course'), id=exam_id)
+    header = {
+        'id': exam.id, 'course': exam.course.code, 'at': _local_iso(exam.date_time),
+        'version': exam.allocation_version,
+    }
+    # One extra row tells us whether there is a next page
+    rows = (
+        SeatAssignment.objects.filter(exam=exam, snapshot_id=exam.published_snapshot_id, id__gt=cursor)
+        .order_by('id')
+        .values_list('id', 'student__registration_number', 'room__name', 'seat_number')[:limit + 1]
+    )
+
+    def stream():
+        yield '{"exam": %s, "results": [' % json.dumps(header, cls=DjangoJSONEncoder)
+        next_cursor = None
+        for count, (row_id, reg, room, seat) in enumerate(rows.iterator(chunk_size=2000)):
+            if count == limit:
+                break
+            yield ('' if count == 0 else ',') + json.dumps({'reg': reg, 'room': room, 'seat': seat})
+            next_cursor = row_id
+        else:
+            next_cursor = None  # Ran out of rows: this was the last page
+        yield '], "next_cursor": %s}' % json.dumps(next_cursor)
+
+    return StreamingHttpResponse(stream(), content_type='application/json')
+
+# --- 7. EXAM ROOM CHECK-IN (Docket QR Scanning) ---
+CHECKIN_MAX_BATCH = 500
+
+@login_required
+@user_passes_test(is_staff)
+def checkin_page(request, exam_id, room_id):
+    exam = get_object_or_404(Exam.objects.select_related('course'), id=exam_id)
+    room = get_object_or_404(Room, id=room_id)
+    return render(request, 'checkin.html', {'exam': exam, 'room': room})
+
+def _accepts_gzip(request):
+    return 'gzip' in request.headers.get('Accept-Encoding', '')
+
+def _pack_etag(request, exam_id, room_id):
+    # Gzipped and plain bodies differ, so they can't share one strong ETag
+    etag = _report_etag(request, exam_id)
+    if etag is None:
+        return None
+    return f"{etag}-room-{room_id}-{'gzip' if _accepts_gzip(request) else 'identity'}"
+
+@login_required
+@user_passes_test(is_staff)
+@vary_on_headers('Accept-Encoding')
+@cache_control(private=True, max_age=0, must_revalidate=True)
+@condition(etag_func=_pack_etag, last_modified_func=_report_last_modified)
+def checkin_pack(request, exam_id, room_id):
+    """The room's roster for offline scanning, built once per allocation version."""
+    exam = get_object_or_404(Exam.objects.select_related('course'), id=exam_id)
+    room = get_object_or_404(Room, id=room_id)
+    pack = room_pack(exam, room)
+    if not _accepts_gzip(request):
+        return HttpResponse(gzip.decompress(pack), content_type='application/json')
+    response = HttpResponse(pack, content_type='application/json')
+    response['Content-Encoding'] = 'gzip'
+    return response
+
+@login_required
+@user_passes_test(is_staff)
+@require_http_methods(['POST'])
+def checkin_sync(request, exam_id, room_id):
+    """
+    POST {"scans": [{"code": "<qr text>", "at": <epoch ms>}, ...]}
+    Scanners queue scans and send them in batches; each batch is one bulk insert.
+    """
     exam = get_object_or_404(Exam, id=exam_id)
-    assignments = SeatAssignment.objects.filter(exam=exam).order_by('room__name', 'seat_number')
-    return render(request, 'door_lists.html', {'exam': exam, 'assignments': assignments})
\ No newline at end of file
+    room = get_object_or_404(Room, id=room_id)
+    try:
+        scans = json.loads(request.body or b'{}').get('scans', [])
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Body must be JSON like {"scans": [...]}'}, status=400)
+    if not isinstance(scans, list) or not all(isinstance(scan, dict) for scan in scans):
+        return JsonResponse({'error': 'scans must be a list of objects.'}, status=400)
+    if len(scans) > CHECKIN_MAX_BATCH:
+        return JsonResponse({'error': f'At most {CHECKIN_MAX_BATCH} scans per request.'}, status=400)
+
+    return JsonResponse({'results': record_scans(exam, room, scans)})